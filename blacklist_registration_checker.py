@@ -2,12 +2,17 @@ import re
 import sys
 import os
 import csv
+import glob
+import struct
+import hashlib
 import openpyxl
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from openpyxl.workbook import Workbook
 from datetime import datetime
 from ipaddress import IPv4Address
 
-from utils import DOWNLOAD_PATH, get_nth_weekday_of_month, get_sys_arg
+from utils import DOWNLOAD_PATH, get_nth_weekday_of_month
 
 # デフォルトのファイルパスとAdmin/Webの対象番号リスト
 DEFAULT_FILE_PATH = os.path.join(DOWNLOAD_PATH,f"エラー報告レポート（{get_nth_weekday_of_month(0, 4, 2).strftime('%Y_%-m_%-d')}）.xlsx")
@@ -29,6 +34,15 @@ OUTPUT_CSV_FILENAME = f'エラーレポートIPチェック_{datetime.now():%Y%m
 # シート名
 RESULT_SHEET_NAME = '集計結果'
 
+# IPリストのキャッシュ（読み込み元ファイルと同じディレクトリに作成する）
+IP_CACHE_SUFFIX = '.ipcache'
+# マジック, 読み込み元の更新日時(ns), サイズ, SHA-1, IP件数
+IP_CACHE_HEADER = struct.Struct('<4sqq20sI')
+IP_CACHE_MAGIC = b'IPC1'
+
+# 一括チェック時に対象とするレポートファイル名のパターン
+REPORT_FILE_PATTERN = 'エラー報告レポート（*）.xlsx'
+
 # IPアドレスが有効かチェックする関数
 def is_valid_ip(ip: str) -> bool:
     return ip is not None and IPv4Address(ip)
@@ -37,7 +51,7 @@ def is_valid_ip(ip: str) -> bool:
 def file_exists(item_name: str, path: str) -> None:
     if not os.path.isfile(path):
         print(f'{os.path.abspath(path)}: {item_name}は存在しません。引数を確認してください。')
-        sys.exit()
+        sys.exit(1)
 
 # IPアドレスを読み込む関数
 def load_ip_addresses(file_path: str) -> list:
@@ -45,11 +59,85 @@ def load_ip_addresses(file_path: str) -> list:
         data = file.read()
     return find_ip_addresses(data)
 
+# IPアドレスを整数の集合として読み込む関数（キャッシュが有効な場合はキャッシュから読み込む）
+def load_ip_set(file_path: str) -> frozenset:
+    cache_path = file_path + IP_CACHE_SUFFIX
+    stat = os.stat(file_path)
+    ips, digest = read_ip_cache(cache_path, file_path, stat)
+    if ips is not None:
+        return frozenset(ips)
+
+    ips = array('I', (int(IPv4Address(ip)) for ip in load_ip_addresses(file_path)))
+    write_ip_cache(cache_path, stat, digest or file_sha1(file_path), ips)
+    return frozenset(ips)
+
+# IPリストのキャッシュを読み込む関数（キャッシュが無効・破損している場合はNoneと計算済みのSHA-1を返す）
+def read_ip_cache(cache_path: str, file_path: str, stat: os.stat_result) -> tuple:
+    digest = None
+    if not os.path.isfile(cache_path):
+        return None, digest
+    try:
+        with open(cache_path, 'rb') as cache:
+            header = cache.read(IP_CACHE_HEADER.size)
+            if len(header) != IP_CACHE_HEADER.size:
+                return None, digest
+            magic, mtime_ns, size, cached_digest, count = IP_CACHE_HEADER.unpack(header)
+            if magic != IP_CACHE_MAGIC:
+                return None, digest
+            # 更新日時・サイズが一致しない場合でも、内容が同じならキャッシュを使う
+            valid = (mtime_ns, size) == (stat.st_mtime_ns, stat.st_size)
+            if not valid:
+                digest = file_sha1(file_path)
+                valid = digest == cached_digest
+            if not valid:
+                return None, digest
+            ips = array('I')
+            payload = cache.read(count * ips.itemsize)
+    except OSError as e:
+        # キャッシュが読めなくても処理は継続する
+        print(f'IPリストのキャッシュを読み込めませんでした。path={cache_path} {e}')
+        return None, digest
+
+    # 途中で切れた・壊れたキャッシュは読み込まず、読み込み元から作り直す
+    if len(payload) != count * ips.itemsize:
+        return None, digest
+    ips.frombytes(payload)
+    if sys.byteorder == 'big':
+        ips.byteswap()
+    if digest is not None:
+        # 内容が同じで更新日時・サイズだけ変わった場合は、次回SHA-1を計算しなくて済むようヘッダを更新する
+        write_ip_cache(cache_path, stat, digest, ips)
+    return ips, digest
+
+# ファイルのSHA-1を計算する関数
+def file_sha1(file_path: str) -> bytes:
+    with open(file_path, 'rb') as file:
+        return hashlib.sha1(file.read()).digest()
+
+# IPリストのキャッシュを書き込む関数
+def write_ip_cache(cache_path: str, stat: os.stat_result, digest: bytes, ips: array) -> None:
+    data = array('I', ips)
+    if sys.byteorder == 'big':
+        data.byteswap()
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as cache:
+            cache.write(IP_CACHE_HEADER.pack(IP_CACHE_MAGIC, stat.st_mtime_ns, stat.st_size, digest, len(data)))
+            cache.write(data.tobytes())
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        # キャッシュが書けなくても処理は継続する
+        print(f'IPリストのキャッシュを書き込めませんでした。path={cache_path} {e}')
+
 # 文字列からIPアドレスを抽出する関数
 def find_ip_addresses(data: str) -> list:
     ip_list = re.findall(IP_ADDRESS_PATTERN, data)
     return [ip for ip in ip_list if is_valid_ip(ip)]
 
+# カンマ区切りの番号リストを整数のリストに変換する関数
+def parse_no_list(s: str) -> list:
+    return [int(x) for x in s.split(',')]
+
 # 文字列を整数に変換する関数
 def try_parse_int(s: str) -> tuple:
     if s is None:
@@ -60,6 +148,11 @@ def try_parse_int(s: str) -> tuple:
     except ValueError:
         return False, 0
 
+# レポートのファイル名から日付(%Y%m%d)を取得する関数
+def get_report_date(file_path: str) -> str:
+    date_str = re.findall('\（.+?\）', os.path.basename(file_path))[0]
+    return datetime.strptime(date_str, "（%Y_%m_%d）").strftime('%Y%m%d')
+
 # ワークブック内に指定されたシートが存在するかチェックする関数
 def any_worksheet_exists(workbook: Workbook, sheet_name: str) -> bool:
     return any(ws.title == sheet_name for ws in workbook.worksheets)
@@ -73,20 +166,18 @@ def print_list(items: list):
 def is_string_list_any(str_list: list, key: str) -> bool:
     return any(key in item for item in str_list)
 
-# ホワイトリストを読み込み、リストとして返す関数
-def load_white_list(file_path: str) -> list:
+# ホワイトリストを読み込み、IPアドレス(整数)の集合として返す関数
+def load_white_list(file_path: str) -> frozenset:
     print(f'ホワイトリスト読み込み path={os.path.abspath(file_path)}')
-    ip_white_list = load_ip_addresses(file_path)
-    print(f'ホワイトリスト読み込み結果')
-    print_list(ip_white_list)
+    ip_white_list = load_ip_set(file_path)
+    print(f'ホワイトリスト読み込み結果: {len(ip_white_list)}件')
     return ip_white_list
 
-# ブラックリストを読み込み、リストとして返す関数
-def load_black_list(file_path: str) -> list:
+# ブラックリストを読み込み、IPアドレス(整数)の集合として返す関数
+def load_black_list(file_path: str) -> frozenset:
     print(f'ブラックリスト読み込み path={os.path.abspath(file_path)}')
-    ip_black_list = load_ip_addresses(file_path)
-    print(f'ブラックリスト読み込み結果')
-    print_list(ip_black_list)
+    ip_black_list = load_ip_set(file_path)
+    print(f'ブラックリスト読み込み結果: {len(ip_black_list)}件')
     return ip_black_list
 
 # エラー報告レポートから該当エラーのIPアドレスを抽出し、リストとして返す関数
@@ -99,7 +190,7 @@ def extract_error_ips(file_path: str, admin_no_list: list, web_no_list:list) ->
     target_sheet_name = RESULT_SHEET_NAME
     if not any_worksheet_exists(wb, target_sheet_name):
         print(f'指定されたシート "{target_sheet_name}" は存在しません。')
-        sys.exit()
+        sys.exit(1)
 
     ws = wb[target_sheet_name]
     admin_flg = False
@@ -130,8 +221,7 @@ def extract_error_ips(file_path: str, admin_no_list: list, web_no_list:list) ->
             if web_flg:
                 execute(web_no_list, web_target_list)
 
-    date_str = re.findall('\（.+?\）', os.path.basename(file_path))[0]
-    target_sheet_name = datetime.strptime(date_str, "（%Y_%m_%d）").strftime('%Y%m%d')
+    target_sheet_name = get_report_date(file_path)
     
     if any_worksheet_exists(wb, target_sheet_name):
         ws = wb[target_sheet_name]
@@ -184,17 +274,18 @@ def extract_error_ips(file_path: str, admin_no_list: list, web_no_list:list) ->
         return [],{},{}
 
 # エラーのIPアドレスをカテゴリー分けし、リストとして返す関数
-def categorize_ips(ip_list: list, ip_white_list: list, ip_black_list: list, admin_res_dic: dict, web_res_dic: dict) -> tuple:
+def categorize_ips(ip_list: list, ip_white_list: frozenset, ip_black_list: frozenset, admin_res_dic: dict, web_res_dic: dict) -> tuple:
     res_white_ip_list = []
     res_black_ip_list = []
     res_black_ip_list_regist_request = []
 
     print(f'該当エラーIP振り分け')
     for ip in ip_list:
-        if ip in ip_white_list:
+        ip_value = int(IPv4Address(ip))
+        if ip_value in ip_white_list:
             res_white_ip_list.append(ip)
             message = 'ホワイトリストに含まれているため追加不要'
-        elif ip in ip_black_list:
+        elif ip_value in ip_black_list:
             res_black_ip_list.append(ip)
             message = '既にブラックリストに含まれているため追加不要'
         else:
@@ -213,8 +304,8 @@ def categorize_ips(ip_list: list, ip_white_list: list, ip_black_list: list, admi
     return res_white_ip_list, res_black_ip_list, res_black_ip_list_regist_request
 
 # 結果をCSVファイルに書き込む関数
-def write_to_csv(res_white_ip_list: list, res_black_ip_list: list, res_black_ip_list_regist_request: list):
-    with open(OUTPUT_CSV_FILENAME, 'w+', newline='', encoding='cp932') as csvfile:
+def write_to_csv(res_white_ip_list: list, res_black_ip_list: list, res_black_ip_list_regist_request: list, output_file_name: str = OUTPUT_CSV_FILENAME):
+    with open(output_file_name, 'w+', newline='', encoding='cp932') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(['ホワイトリストに含まれているIP', '既にブラックリストに含まれているIP', 'ブラックリスト登録依頼IP'])
         count_list = []
@@ -226,13 +317,11 @@ def write_to_csv(res_white_ip_list: list, res_black_ip_list: list, res_black_ip_
             writer.writerow([get_item(res_white_ip_list), get_item(res_black_ip_list), get_item(res_black_ip_list_regist_request)])
 
 # メイン関数
-def main():
-    # ファイルパスと管理者/ウェブの番号リストを取得
-    file_path = get_sys_arg(1, DEFAULT_FILE_PATH)
-    admin_no_list = [int(x) for x in get_sys_arg(2, DEFAULT_ADMIN_NO_LIST).split(',')]
-    web_no_list = [int(x) for x in get_sys_arg(3, DEFAULT_WEB_NO_LIST).split(',')]
-    white_ip_file_path = get_sys_arg(4, DEFAULT_WHITE_IP_FILE_PATH)
-    black_ip_file_path = get_sys_arg(5, DEFAULT_BLACK_IP_FILE_PATH)
+def main(file_path: str = DEFAULT_FILE_PATH, admin_no_list: list = None, web_no_list: list = None,
+         white_ip_file_path: str = DEFAULT_WHITE_IP_FILE_PATH, black_ip_file_path: str = DEFAULT_BLACK_IP_FILE_PATH):
+    # 管理者/ウェブの番号リストが省略された場合はデフォルトを使う
+    admin_no_list = admin_no_list or parse_no_list(DEFAULT_ADMIN_NO_LIST)
+    web_no_list = web_no_list or parse_no_list(DEFAULT_WEB_NO_LIST)
 
     file_exists('エラー報告レポート', file_path)
     file_exists('IPホワイトリスト', white_ip_file_path)
@@ -245,5 +334,65 @@ def main():
     res_white_ip_list, res_black_ip_list, res_black_ip_list_regist_request = categorize_ips(ip_list, ip_white_list, ip_black_list, admin_res_dic, web_res_dic)
     write_to_csv(res_white_ip_list, res_black_ip_list, res_black_ip_list_regist_request)
 
+# 一括チェックのワーカープロセスで共有するIPリスト
+_shared_ip_lists = {}
+
+# ワーカープロセスの初期化関数（IPリストはワーカーごとに一度だけ受け取る）
+def init_batch_worker(ip_white_list: frozenset, ip_black_list: frozenset):
+    _shared_ip_lists['white'] = ip_white_list
+    _shared_ip_lists['black'] = ip_black_list
+
+# レポート1件分のチェックを行い、結果CSVのパスを返す関数
+def check_report(file_path: str, admin_no_list: list, web_no_list: list) -> str:
+    output_file_name = os.path.join(os.path.dirname(os.path.abspath(file_path)), f'エラーレポートIPチェック_{get_report_date(file_path)}.csv')
+    ip_list, admin_res_dic, web_res_dic = extract_error_ips(file_path, admin_no_list, web_no_list)
+    res_white_ip_list, res_black_ip_list, res_black_ip_list_regist_request = categorize_ips(ip_list, _shared_ip_lists['white'], _shared_ip_lists['black'], admin_res_dic, web_res_dic)
+    write_to_csv(res_white_ip_list, res_black_ip_list, res_black_ip_list_regist_request, output_file_name)
+    return output_file_name
+
+# 引数のファイル・ディレクトリから一括チェック対象のレポートを列挙する関数
+def find_report_files(paths: list) -> list:
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_paths.extend(sorted(glob.glob(os.path.join(path, REPORT_FILE_PATTERN))))
+        else:
+            file_exists('エラー報告レポート', path)
+            file_paths.append(path)
+    return file_paths
+
+# 複数のエラー報告レポートを一括でチェックする関数
+def main_batch(paths: list, admin_no_list: list = None, web_no_list: list = None,
+               white_ip_file_path: str = DEFAULT_WHITE_IP_FILE_PATH, black_ip_file_path: str = DEFAULT_BLACK_IP_FILE_PATH,
+               max_workers: int = None) -> dict:
+    admin_no_list = admin_no_list or parse_no_list(DEFAULT_ADMIN_NO_LIST)
+    web_no_list = web_no_list or parse_no_list(DEFAULT_WEB_NO_LIST)
+    file_paths = find_report_files(paths)
+    if not file_paths:
+        print(f'{", ".join(os.path.abspath(path) for path in paths)}: {REPORT_FILE_PATTERN} に一致するエラー報告レポートが見つかりません。')
+        sys.exit(1)
+
+    file_exists('IPホワイトリスト', white_ip_file_path)
+    file_exists('IPブラックリスト', black_ip_file_path)
+    ip_white_list = load_white_list(white_ip_file_path)
+    ip_black_list = load_black_list(black_ip_file_path)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_batch_worker, initargs=(ip_white_list, ip_black_list)) as executor:
+        futures = {file_path: executor.submit(check_report, file_path, admin_no_list, web_no_list) for file_path in file_paths}
+        for file_path, future in futures.items():
+            try:
+                results[file_path] = future.result()
+            except (Exception, SystemExit) as e:
+                # 1件の失敗で他のレポートのチェックを止めない
+                print(f'チェックに失敗しました。path={os.path.abspath(file_path)} {e!r}')
+                results[file_path] = None
+
+    print(f'一括チェック結果')
+    for file_path, output_file_name in results.items():
+        print(f'{os.path.basename(file_path)}: {output_file_name or "失敗"}')
+    return results
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import monthly_report
+    sys.exit(monthly_report.main(['check'] + sys.argv[1:]))
\ No newline at end of file
@@ -1,42 +1,66 @@
 import html
 import os
-from typing import List
+import re
+from typing import Iterable, Optional, Tuple
 import get_log_php
 import get_log_laravel
-from log_entry import LogEntry
+from log_entry import LogEntry, merge_log_entries
+from log_analysis import EntryColumns, write_time_series_arrays_to_excel
 from openpyxl import Workbook, load_workbook
+from openpyxl.utils import quote_sheetname
+from openpyxl.workbook.defined_name import DefinedName
 from datetime import datetime
 import openpyxl.utils.exceptions as openpyxl_exceptions
 from utils import get_aggregation_period, get_last_weekday_of_month, DOWNLOAD_PATH, get_nth_weekday_of_month
 
+# 自動出力した行の範囲を記録するワークシートの名前定義
+OUTPUT_RANGE_NAME = '_auto_log_output'
+
 def sanitize_string(input_string):
     return html.escape(input_string)
 
-def write_to_excel(entries: List[LogEntry], file_name: str, tab_name: str):
+def write_to_excel(entries: Iterable[LogEntry], file_name: str, tab_name: str, start_date: datetime = None, end_date: datetime = None):
     """
     ログエントリをエクセルファイルに書き込む
-    :param entries: ログエントリのリスト
+
+    前回の実行で書き込んだ行はワークシートの名前定義（OUTPUT_RANGE_NAME）に記録しておき、
+    再実行時はその行を消してから同じ位置に書き込み直す（常駐モードで繰り返し実行しても行が重複しない）。
+    :param entries: ログエントリ（渡された順に書き込む）
     :param file_name: 出力するエクセルファイル名
     :param tab_name: 出力するタブ名
+    :param start_date: 集計開始日（省略時は集計期間の開始日）
+    :param end_date: 集計終了日（省略時は集計期間の終了日）
     """
     workbook = load_workbook(filename=file_name)
     sheet = workbook[tab_name]
 
-    # Find the first empty cell in column G
-    g_column = sheet['G']
-    empty_row = 2
-    while g_column[empty_row - 1].value is not None:
-        empty_row += 1
+    previous_range = get_output_range(sheet)
+    if previous_range is not None:
+        # 前回書き込んだ行を消し、同じ行から書き込み直す
+        empty_row, last_row = previous_range
+        for row in sheet.iter_rows(min_row=empty_row, max_row=last_row, min_col=4, max_col=7):
+            for cell in row:
+                cell.value = None
+    else:
+        # Find the first empty cell in column G
+        g_column = sheet['G']
+        empty_row = 2
+        while empty_row <= len(g_column) and g_column[empty_row - 1].value is not None:
+            empty_row += 1
 
-    start_date, end_date = get_aggregation_period()
+    default_start_date, default_end_date = get_aggregation_period()
+    start_date = start_date or default_start_date
+    end_date = end_date or default_end_date
     sheet.cell(row=1, column=1, value=f'集計期間:{start_date}~{end_date}')
 
     # Set the starting row for data output
     starting_row = max(empty_row, 3)
+    first_row = starting_row
 
     # Write the data again starting from the first empty row
     for entry in entries:
-        row = [entry.date, entry.server, entry.location, entry.content]
+        # エクセルはタイムゾーン付きの日時を扱えないため、LOG_TIMEZONEの時刻として書き込む
+        row = [entry.date.replace(tzinfo=None), entry.server, entry.location, entry.content]
         for idx, value in enumerate(row):
           try:
               sheet.cell(row=starting_row, column=4 + idx, value=value)
@@ -45,23 +69,78 @@ def write_to_excel(entries: List[LogEntry], file_name: str, tab_name: str):
               print(f'openpyxl_exceptions.IllegalCharacterError row:{starting_row} col:{4 + idx}\n{value}')
         starting_row += 1
 
+    set_output_range(sheet, first_row, starting_row - 1)
     workbook.save(file_name)
 
 
-def main():
+def get_output_range(sheet) -> Optional[Tuple[int, int]]:
+    """
+    前回書き込んだ行の範囲をワークシートの名前定義から取得する
+    :param sheet: ワークシート
+    :return: (開始行, 終了行) のタプル。記録がない場合はNone
+    """
+    defined_name = sheet.defined_names.get(OUTPUT_RANGE_NAME)
+    if defined_name is None:
+        return None
+    match = re.search(r'\$D\$(\d+):\$G\$(\d+)$', defined_name.attr_text)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def set_output_range(sheet, first_row: int, last_row: int) -> None:
+    """
+    書き込んだ行の範囲をワークシートの名前定義に記録する（0件の場合も開始行を記録する）
+    :param sheet: ワークシート
+    :param first_row: 開始行
+    :param last_row: 終了行
+    """
+    last_row = max(last_row, first_row)
+    attr_text = f"{quote_sheetname(sheet.title)}!$D${first_row}:$G${last_row}"
+    sheet.defined_names[OUTPUT_RANGE_NAME] = DefinedName(OUTPUT_RANGE_NAME, attr_text=attr_text)
+
+
+def get_default_report() -> Tuple[str, str]:
+    """
+    デフォルトの出力先エクセルファイルとタブ名を取得する
+    :return: エクセルファイル名とタブ名のタプル
+    """
     file_date: datetime = get_nth_weekday_of_month(0, 4, 2)
     formatted_file_date: str = file_date.strftime('%Y_%-m_%-d')  # フォーマットした文字列を取得
     output_file_name: str = os.path.join(DOWNLOAD_PATH,f"エラー報告レポート（{formatted_file_date}）.xlsx")
+    return output_file_name, file_date.strftime('%Y%m%d')
+
+
+def main(output_file_name: str = None, tab_name: str = None, start_date: datetime = None, end_date: datetime = None, output_directory: str = None) -> bool:
+    """
+    ログを取得してエクセルファイルに書き込む
+    :param output_file_name: 出力するエクセルファイル名（省略時はget_default_report）
+    :param tab_name: 出力するタブ名（省略時はget_default_report）
+    :param start_date: 集計開始日（省略時は集計期間の開始日）
+    :param end_date: 集計終了日（省略時は集計期間の終了日）
+    :param output_directory: ログファイルの出力ディレクトリ（省略時はカレントディレクトリ/%Y%m%d%H%M%S）
+    :return: 書き込みを行った場合はTrue
+    """
+    default_output_file_name, default_tab_name = get_default_report()
+    output_file_name = output_file_name or default_output_file_name
+    tab_name = tab_name or default_tab_name
     if not os.path.exists(output_file_name):
         print(f'出力先ファイルが見つかりません。path={output_file_name}')
-        return
-    output_directory:str = os.path.join(os.getcwd(),datetime.today().strftime('%Y%m%d%H%M%S'))
-    start_date, end_date = get_aggregation_period()
-    log_entries =  get_log_php.main(output_directory, start_date, end_date)
-    log_entries.extend(get_log_laravel.main(output_directory, start_date, end_date))
-    tab_name: str = file_date.strftime('%Y%m%d')
-    write_to_excel(log_entries, output_file_name, tab_name)
+        return False
+    output_directory = output_directory or os.path.join(os.getcwd(),datetime.today().strftime('%Y%m%d%H%M%S'))
+    default_start_date, default_end_date = get_aggregation_period()
+    start_date = start_date or default_start_date
+    end_date = end_date or default_end_date
+    # 各取得元のログは日時順に返されるため、全体をリストにせずに日時順に結合して書き込む
+    log_entries = merge_log_entries(get_log_php.main(output_directory, start_date, end_date),
+                                    get_log_laravel.main(output_directory, start_date, end_date))
+    columns = EntryColumns()
+    write_to_excel(columns.collect(log_entries), output_file_name, tab_name, start_date, end_date)
+    write_time_series_arrays_to_excel(*columns.to_arrays(), start_date, end_date, output_file_name, tab_name)
+    return True
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import sys
+    import monthly_report
+    sys.exit(monthly_report.main(['report'] + sys.argv[1:]))
@@ -1,12 +1,10 @@
 import sys
-from typing import List
+from typing import Iterator, List
 import re
 import os
-import boto3
 from datetime import datetime, timedelta
-from botocore.exceptions import ClientError
-from log_entry import LogEntry
-from utils import get_aggregation_period, get_nth_weekday_of_month, get_sys_arg_date
+from log_entry import LogEntry, merge_log_entries
+from utils import get_aggregation_period, get_aws_client
 
 DIVISONS = {
     'web':'nfs',
@@ -86,7 +84,10 @@ def download_log_file(s3_bucket: str, s3_key: str, local_file_path: str) -> None
     Returns:
         None: 正常にダウンロードされた場合は戻り値はありません
     """
-    s3 = boto3.client('s3')
+    # botocoreは読み込みに時間がかかるため、ダウンロード時に読み込む
+    from botocore.exceptions import ClientError
+
+    s3 = get_aws_client('s3')
     try:
         # オブジェクトの存在を確認
         s3.head_object(Bucket=s3_bucket, Key=s3_key)
@@ -136,80 +137,129 @@ def create_directory(directory: str) -> None:
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-def main() -> List[LogEntry]:
-    output_directory = f'/Users/h.obashi/PwC/plat4/document/{datetime.now().strftime("%Y%m%d%H%M%S")}'
-    start_date, end_date = get_aggregation_period()
-    start_date = get_sys_arg_date(1, start_date)
-    end_date = get_sys_arg_date(2, end_date)
-    return main(output_directory, start_date, end_date)
+def load_day_logs(directory_path: str, division: str, formatted_date: str) -> List[LatavelLogEntry]:
+    """
+    1日分のログファイルをS3からダウンロードして解析する
+
+    Parameters:
+        directory_path (str): ローカルに保存するディレクトリのパス
+        division (str): S3上のディレクトリ名 (DIVISONSの値)
+        formatted_date (str): 対象日付 (%Y-%m-%d)
 
-def main(output_directory:str, start_date:datetime, end_date:datetime) -> List[LogEntry]:
+    Returns:
+        List[LatavelLogEntry]: 解析されたログ（日時順）。ログが存在しない場合は空のリスト
     """
-    メイン関数。指定された日付範囲のログファイルをダウンロードして解析し、エラーログを出力します。
+    # ローカルに保存するファイルパス
+    local_file_path = os.path.join(directory_path, f'laravel-{formatted_date}.log')
+
+    # S3のバケット名とキー
+    s3_bucket = 'production-app-auditlog'
+    s3_key = f'{division}/laravel-{formatted_date}.log'
+
+    # ファイルのダウンロード
+    download_log_file(s3_bucket, s3_key, local_file_path)
+
+    # ファイルが存在しない場合(範囲外の日付を指定された場合など)は処理しない
+    if not os.path.exists(local_file_path):
+        return []
+
+    # ファイルの読み込みとログの解析
+    log_data = read_log_file(local_file_path)
+    log_parser = LogParser(log_data)
+    # 複数のPHP-FPMプロセスが同時に追記すると前後することがあるため、日時順に並べ替える（k-wayマージの前提）
+    return sorted(log_parser.parse_logs(), key=lambda log: datetime.fromisoformat(log.time))
+
+def fetch_day(server: str, day: datetime, output_directory: str) -> List[LogEntry]:
+    """
+    指定したサーバ・日付1日分のエラーログを取得します。（分散実行の作業単位）
 
     Parameters:
-        start_date (datetime): ダウンロード対象の開始日付
-        end_date (datetime): ダウンロード対象の終了日付
+        server (str): サーバ名 (DIVISONSのキー)
+        day (datetime): 取得対象の日付
         output_directory (str): ログファイルの出力ディレクトリ
     """
+    directory_path = os.path.join(output_directory, server)
+    create_directory(directory_path)
+    parsed_logs = load_day_logs(directory_path, DIVISONS[server], day.strftime("%Y-%m-%d"))
+    return [to_log_entry(log, server) for log in parsed_logs if log.level == "ERROR"]
+
+def to_log_entry(log: LatavelLogEntry, server: str) -> LogEntry:
+    """
+    LatavelLogEntryをLogEntryに変換する（ログの時刻はLOG_TIMEZONEの時刻とみなす）
+
+    Parameters:
+        log (LatavelLogEntry): 変換するログ
+        server (str): サーバ名
+
+    Returns:
+        LogEntry: 変換したLogEntry
+    """
+    return LogEntry(datetime.fromisoformat(log.time), server, 'アプリケーションログ', log.message)
+
+def main(output_directory:str = None, start_date:datetime = None, end_date:datetime = None) -> Iterator[LogEntry]:
+    """
+    メイン関数。指定された日付範囲のログファイルをダウンロードして解析し、エラーログを出力します。
+
+    Parameters:
+        start_date (datetime): ダウンロード対象の開始日付（省略時は集計期間の開始日）
+        end_date (datetime): ダウンロード対象の終了日付（省略時は集計期間の終了日）
+        output_directory (str): ログファイルの出力ディレクトリ（省略時はカレントディレクトリ/%Y%m%d%H%M%S）
+
+    Returns:
+        Iterator[LogEntry]: 全サーバのエラーログを日時順に結合したイテレータ
+    """
+    default_start_date, default_end_date = get_aggregation_period()
+    start_date = start_date or default_start_date
+    end_date = end_date or default_end_date
+    output_directory = output_directory or os.path.join(os.getcwd(), datetime.now().strftime("%Y%m%d%H%M%S"))
 
-    result:List[LogEntry] = []
     # 日付範囲のリストを作成
     formatted_dates = []
     current_date = start_date
     while current_date <= end_date:
         formatted_dates.append(current_date.strftime("%Y-%m-%d"))
-        current_date += timedelta(days=1)        
-    
+        current_date += timedelta(days=1)
 
+    streams = []
     for server, division in DIVISONS.items():
-        # すべてのログを格納するリスト
-        all_logs: List[LatavelLogEntry] = []
-
         # ローカルに保存するディレクトリ
         directory_path = os.path.join(output_directory, server)
         create_directory(directory_path)
+        streams.append(iter_error_logs(server, division, directory_path, formatted_dates))
 
-        for formatted_date in formatted_dates:
-            # ローカルに保存するファイルパス
-            local_file_path = os.path.join(directory_path, f'laravel-{formatted_date}.log')
+    return merge_log_entries(*streams)
 
-            # S3のバケット名とキー
-            s3_bucket = 'production-app-auditlog'
-            s3_key = f'{division}/laravel-{formatted_date}.log'
+def iter_error_logs(server: str, division: str, directory_path: str, formatted_dates: List[str]) -> Iterator[LogEntry]:
+    """
+    1サーバ分のエラーログを日付順にダウンロード・解析し、ファイルに書き込みながら日時順に返す
 
-            # ファイルのダウンロード
-            download_log_file(s3_bucket, s3_key, local_file_path)
+    ログファイルは日付ごとに分かれており、各ファイルのログはload_day_logsで日時順に並べ替えている。
 
-            # ファイルが存在しない場合(範囲外の日付を指定された場合など)は処理しない
-            if not os.path.exists(local_file_path):
-                continue
+    Parameters:
+        server (str): サーバ名
+        division (str): S3上のディレクトリ名
+        directory_path (str): ローカルに保存するディレクトリのパス
+        formatted_dates (List[str]): 対象日付 (%Y-%m-%d) の昇順のリスト
 
-            # ファイルの読み込みとログの解析
-            log_data = read_log_file(local_file_path)
-            log_parser = LogParser(log_data)
-            parsed_logs = log_parser.parse_logs()
+    Returns:
+        Iterator[LogEntry]: エラーログのイテレータ
+    """
+    output_file_path = f'{directory_path}/laravel.error.log'
+    with open(output_file_path, 'w') as file:
+        for formatted_date in formatted_dates:
+            parsed_logs = load_day_logs(directory_path, division, formatted_date)
 
             # デバッグ用に最初の一件目のmessageを出力
             if parsed_logs:
                 first_message = parsed_logs[0].message
                 print(f'First Message ({formatted_date}):', first_message)
 
-            # 解析結果をすべてのログリストに追加
-            all_logs.extend(parsed_logs)
-
-        error_logs = [log for log in all_logs if log.level == "ERROR"]
-
-        for log in error_logs:
-            result.append(LogEntry(log.time, server, 'アプリケーションログ', log.message))
-
-        # ファイルにログを書き込み
-        output_file_path = f'{directory_path}/laravel.error.log'
-        write_logs_to_file(error_logs, output_file_path)
-    
-    return result
-
+            for log in parsed_logs:
+                if log.level == "ERROR":
+                    # ファイルにログを書き込み
+                    file.write(str(log) + '\n')
+                    yield to_log_entry(log, server)
 
 if __name__ == "__main__":
-    # LogParserのインスタンスを作成してmainメソッドを実行
-    main()
+    import monthly_report
+    sys.exit(monthly_report.main(['fetch', '--source', 'laravel'] + sys.argv[1:]))
@@ -1,10 +1,9 @@
-import boto3
 import sys
 import os
 from datetime import datetime
-from typing import List
-from log_entry import LogEntry
-from utils import get_aggregation_period, get_sys_arg
+from typing import Iterator, List
+from log_entry import LogEntry, merge_log_entries
+from utils import get_aggregation_period, get_aws_client, LOG_TIMEZONE
 
 LOG_GROUP_NAME = 'log'
 LOG_STREAM_ADMIN = '/var/log/httpd/admin.cisocyber.jp.pwc.com.error.log'
@@ -27,48 +26,58 @@ def get_log_entries(log_group_name, log_stream_name, start_time, end_time, serve
     :param region_name: リージョン名
     :return: LogEntry オブジェクトのリスト
     """
-    client = boto3.client('logs', region_name=region_name)
-    log_entries = []
+    return list(iter_log_entries(log_group_name, log_stream_name, start_time, end_time, server, region_name))
 
-    # Retrieve log entries
-    def retrieve_log_entries():
+
+def iter_log_entries(log_group_name, log_stream_name, start_time, end_time, server, region_name=None) -> Iterator[LogEntry]:
+    """
+    CloudWatch Logs からログエントリを1ページずつ取得し、日時順に返す
+
+    ログストリームのイベントは startFromHead=True で古い順に返されるため、ページの順に返せば日時順になる。
+
+    :param log_group_name: ロググループ名
+    :param log_stream_name: ログストリーム名
+    :param start_time: 取得開始時間 (UNIX タイムスタンプ)
+    :param end_time: 取得終了時間 (UNIX タイムスタンプ)
+    :param server: サーバ名
+    :param region_name: リージョン名
+    :return: LogEntry オブジェクトのイテレータ
+    """
+    client = get_aws_client('logs', region_name)
+
+    print(f"get_log_event:{log_stream_name}")
+
+    response = client.get_log_events(
+        logGroupName=log_group_name,
+        logStreamName=log_stream_name,
+        startTime=start_time,
+        endTime=end_time,
+        startFromHead=True)
+    for event in response['events']:
+        yield parse_log_entry(event, server)
+    while True:
+        prev_token = response['nextForwardToken']
+        if 'ResponseMetadata' in response:
+            response_metadata = response['ResponseMetadata']
+            if 'HTTPHeaders' in response_metadata:
+                http_headers = response_metadata['HTTPHeaders']
+                if 'date' in http_headers:
+                    date_value = http_headers['date']
+                    parsed_date = datetime.strptime(date_value, '%a, %d %b %Y %H:%M:%S %Z')
+                    formatted_date = parsed_date.strftime('%Y/%m/%d %H:%M:%S')
+                    print(f"Formatted Date: {formatted_date}")
         response = client.get_log_events(
             logGroupName=log_group_name,
             logStreamName=log_stream_name,
             startTime=start_time,
             endTime=end_time,
-            startFromHead=True)
+            nextToken=prev_token)
         for event in response['events']:
-            log_entries.append(parse_log_entry(event, server))
-        while True:
-            prev_token = response['nextForwardToken']
-            if 'ResponseMetadata' in response:
-                response_metadata = response['ResponseMetadata']
-                if 'HTTPHeaders' in response_metadata:
-                    http_headers = response_metadata['HTTPHeaders']
-                    if 'date' in http_headers:
-                        date_value = http_headers['date']
-                        parsed_date = datetime.strptime(date_value, '%a, %d %b %Y %H:%M:%S %Z')
-                        formatted_date = parsed_date.strftime('%Y/%m/%d %H:%M:%S')
-                        print(f"Formatted Date: {formatted_date}")
-            response = client.get_log_events(
-                logGroupName=log_group_name,
-                logStreamName=log_stream_name,
-                startTime=start_time,
-                endTime=end_time,
-                nextToken=prev_token)
-            for event in response['events']:
-                log_entries.append(parse_log_entry(event, server))
-
-            if response['nextForwardToken'] == prev_token:
-                print("break")
-                break
+            yield parse_log_entry(event, server)
 
-    print(f"get_log_event:{log_stream_name}")
-
-    retrieve_log_entries()
-
-    return log_entries
+        if response['nextForwardToken'] == prev_token:
+            print("break")
+            break
 
 
 def parse_log_entry(event, server) -> LogEntry:
@@ -79,31 +88,46 @@ def parse_log_entry(event, server) -> LogEntry:
     :param server: サーバ名
     :return: パースされた LogEntry オブジェクト
     """
-    timestamp = datetime.fromtimestamp(int(event['timestamp']) / 1000)
     message = event['message']
-    
-    return LogEntry(timestamp, server, 'PHP', message)
+
+    return LogEntry.from_epoch(int(event['timestamp']), server, 'PHP', message)
 
 
-def main() -> List[LogEntry]:
+def fetch_day(server: str, day: datetime, output_directory: str) -> List[LogEntry]:
     """
-    メイン関数。指定された日付範囲のログファイルをダウンロードして解析し、エラーログを出力します。
+    指定したサーバ・日付1日分のエラーログを取得します。（分散実行の作業単位）
+
+    Parameters:
+        server (str): サーバ名 (LOG_STREAMSのキー)
+        day (datetime): 取得対象の日付
+        output_directory (str): ログファイルの出力ディレクトリ（PHPログでは未使用）
     """
-    start_date, end_date = get_aggregation_period()
-    output_directory = get_sys_arg(1, os.path.join(os.getcwd(),datetime.today().strftime('%Y%m')))
-    return main(output_directory, start_date, end_date)
+    # Laravelログと同じくLOG_TIMEZONEの1日を対象にする
+    start = day.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=LOG_TIMEZONE)
+    end = start.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return get_log_entries(LOG_GROUP_NAME, LOG_STREAMS[server], int(start.timestamp() * 1000), int(end.timestamp() * 1000), server)
 
-def main(output_directory:str, start_date:datetime, end_date:datetime) -> List[LogEntry]:
+
+def main(output_directory:str = None, start_date:datetime = None, end_date:datetime = None) -> Iterator[LogEntry]:
     """
     メイン関数。指定された日付範囲のログファイルをダウンロードして解析し、エラーログを出力します。
 
     Parameters:
-        start_date (datetime): ダウンロード対象の開始日付
-        end_date (datetime): ダウンロード対象の終了日付
-        output_directory (str): ログファイルの出力ディレクトリ
+        start_date (datetime): ダウンロード対象の開始日付（省略時は集計期間の開始日）
+        end_date (datetime): ダウンロード対象の終了日付（省略時は集計期間の終了日）
+        output_directory (str): ログファイルの出力ディレクトリ（省略時はカレントディレクトリ/%Y%m）
+
+    Returns:
+        Iterator[LogEntry]: 全サーバのエラーログを日時順に結合したイテレータ
     """
-    end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-    log_entries: List[LogEntry] = []
+    default_start_date, default_end_date = get_aggregation_period()
+    start_date = start_date or default_start_date
+    end_date = end_date or default_end_date
+    output_directory = output_directory or os.path.join(os.getcwd(), datetime.today().strftime('%Y%m'))
+    # Laravelログと同じくLOG_TIMEZONEの開始日0時から終了日の終わりまでを対象にする
+    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=LOG_TIMEZONE)
+    end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999, tzinfo=LOG_TIMEZONE)
+    streams = []
     for server, log_stream_name in LOG_STREAMS.items():
         disp_start = start_date.strftime('%Y%m%d')
         disp_end = end_date.strftime('%Y%m%d')
@@ -114,18 +138,28 @@ def main(output_directory:str, start_date:datetime, end_date:datetime) -> List[L
         unix_start = int(start_date.timestamp() * 1000)
         unix_end = int(end_date.timestamp() * 1000)
 
-        server_log_entries = get_log_entries(LOG_GROUP_NAME, log_stream_name, unix_start, unix_end, server)
-        log_entries.extend(server_log_entries)
+        server_log_entries = iter_log_entries(LOG_GROUP_NAME, log_stream_name, unix_start, unix_end, server)
+        streams.append(write_log_entries(server_log_entries, file_name))
+
+    return merge_log_entries(*streams)
 
-        with open(file_name, 'w+') as f:
-            for entry in server_log_entries:
-                f.write(str(entry.to_dict()) + '\n')
 
-    # Processed log entries
-    for entry in log_entries:
-        print(entry.to_dict())
-    return log_entries
+def write_log_entries(entries: Iterator[LogEntry], file_name: str) -> Iterator[LogEntry]:
+    """
+    ログエントリをファイルに書き込みながら、そのまま返す
+
+    :param entries: ログエントリのイテレータ
+    :param file_name: 出力するファイル名
+    :return: LogEntry オブジェクトのイテレータ
+    """
+    with open(file_name, 'w+') as f:
+        for entry in entries:
+            f.write(str(entry.to_dict()) + '\n')
+            # Processed log entries
+            print(entry.to_dict())
+            yield entry
 
 
 if __name__ == "__main__":
-    main()
+    import monthly_report
+    sys.exit(monthly_report.main(['fetch', '--source', 'php'] + sys.argv[1:]))
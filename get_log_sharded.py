@@ -0,0 +1,220 @@
+import json
+import os
+import socket
+import traceback
+from itertools import chain, groupby
+from datetime import datetime, timedelta
+from multiprocessing import Process
+from typing import Iterator, Union
+import get_log_php
+import get_log_laravel
+from get_log import write_to_excel
+from log_analysis import EntryColumns, write_time_series_arrays_to_excel
+from log_entry import LogEntry, merge_log_entries
+from work_queue import FileWorkQueue, WorkQueue, WorkUnit, default_worker_name
+
+# キューのファイル名（同一ホスト用）・ディレクトリ名（複数ホスト用）と中間結果のディレクトリ名（作業ディレクトリ配下）
+QUEUE_FILE_NAME = 'queue.sqlite3'
+SHARED_QUEUE_DIR_NAME = 'queue'
+PARTIAL_DIR_NAME = 'partials'
+RAW_LOG_DIR_NAME = 'logs'
+
+# 取得元ごとの1日分の取得関数とサーバ一覧（マニフェストの順序 = 出力順）
+SOURCES = {
+    'php': (get_log_php.fetch_day, list(get_log_php.LOG_STREAMS)),
+    'laravel': (get_log_laravel.fetch_day, list(get_log_laravel.DIVISONS)),
+}
+
+# ローカル実行時のデフォルトのワーカー数
+DEFAULT_WORKER_COUNT = 4
+
+
+def get_queue(work_dir: str, shared: bool = None) -> Union[WorkQueue, FileWorkQueue]:
+    """
+    作業ディレクトリのキューを返す
+
+    Parameters:
+        work_dir (str): 作業ディレクトリ
+        shared (bool): 複数ホスト用のキューの場合はTrue（省略時は作業ディレクトリに作成済みのキューから判定）
+    """
+    if shared is None:
+        shared = os.path.exists(os.path.join(work_dir, SHARED_QUEUE_DIR_NAME))
+    if shared:
+        return FileWorkQueue(os.path.join(work_dir, SHARED_QUEUE_DIR_NAME))
+    return WorkQueue(os.path.join(work_dir, QUEUE_FILE_NAME))
+
+
+def queue_exists(work_dir: str) -> bool:
+    return get_queue(work_dir, False).exists() or get_queue(work_dir, True).exists()
+
+
+def partial_path(work_dir: str, unit: WorkUnit) -> str:
+    return os.path.join(work_dir, PARTIAL_DIR_NAME, f'{unit.unit_id:06d}_{unit.source}_{unit.server}_{unit.day}.jsonl')
+
+
+def plan(work_dir: str, start_date: datetime, end_date: datetime, output_file_name: str, tab_name: str,
+         force: bool = False, shared: bool = False) -> bool:
+    """
+    集計期間を 取得元 × サーバ × 日付 の作業単位に分割し、キューを作成します。
+
+    既存のキューを作り直すと完了済みの作業単位も最初からやり直しになるため、forceを指定しない限り上書きしません。
+    （失敗した作業単位だけを再実行する場合は retry_failed を使ってください）
+
+    Parameters:
+        work_dir (str): 作業ディレクトリ（sharedを指定しない場合、キューはSQLiteのためローカルディスク上に置いてください）
+        start_date (datetime): 集計開始日
+        end_date (datetime): 集計終了日
+        output_file_name (str): reduce時に書き込むエクセルファイル
+        tab_name (str): reduce時に書き込むタブ名
+        force (bool): 既存のキューを破棄して作り直す場合はTrue
+        shared (bool): NFS・SMBなどの共有ストレージ上の作業ディレクトリを複数ホストのワーカーで分担する場合はTrue
+
+    Returns:
+        bool: キューを作成した場合はTrue
+    """
+    if start_date > end_date:
+        print(f'集計期間が不正です。開始日が終了日より後になっています。start={start_date:%Y/%m/%d} end={end_date:%Y/%m/%d}')
+        return False
+    if queue_exists(work_dir):
+        if not force:
+            print(f'作業単位は作成済みです。作り直す場合は --force を指定してください。path={os.path.abspath(work_dir)}')
+            return False
+        get_queue(work_dir, False).remove()
+        get_queue(work_dir, True).remove()
+    queue = get_queue(work_dir, shared)
+    os.makedirs(os.path.join(work_dir, PARTIAL_DIR_NAME), exist_ok=True)
+    days = []
+    current_date = start_date
+    while current_date <= end_date:
+        days.append(current_date.strftime('%Y-%m-%d'))
+        current_date += timedelta(days=1)
+
+    units = [(source, server, day) for source, (_, servers) in SOURCES.items() for server in servers for day in days]
+    meta = {
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'output_file_name': output_file_name,
+        'tab_name': tab_name,
+    }
+    queue.create(units, meta)
+    print(f'作業単位を作成しました。件数={len(units)} path={os.path.abspath(work_dir)}')
+    return True
+
+
+def run_unit(work_dir: str, unit: WorkUnit) -> None:
+    """
+    作業単位1件分のログを取得し、中間結果ファイルに書き込む
+    """
+    fetch_day, _ = SOURCES[unit.source]
+    entries = fetch_day(unit.server, unit.day_as_datetime(), os.path.join(work_dir, RAW_LOG_DIR_NAME, unit.source))
+
+    # 途中で中断されても不完全なファイルが残らないよう、一時ファイルに書いてから置き換える
+    file_name = partial_path(work_dir, unit)
+    tmp_file_name = f'{file_name}.{socket.gethostname()}_{os.getpid()}.tmp'
+    with open(tmp_file_name, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry.to_record(), ensure_ascii=False) + '\n')
+    os.replace(tmp_file_name, file_name)
+
+
+def worker(work_dir: str, worker_name: str = None) -> int:
+    """
+    キューから作業単位を取得して、残りがなくなるまで処理します。
+
+    Returns:
+        int: 処理した作業単位の件数
+    """
+    worker_name = worker_name or default_worker_name()
+    queue = get_queue(work_dir)
+    processed = 0
+    while True:
+        unit = queue.claim(worker_name)
+        if unit is None:
+            break
+        print(f'[{worker_name}] 開始 {unit}')
+        try:
+            run_unit(work_dir, unit)
+        except Exception:
+            print(f'[{worker_name}] 失敗 {unit}')
+            if not queue.fail(unit, traceback.format_exc()):
+                print(f'[{worker_name}] リースが切れたため、失敗を記録しませんでした。 {unit}')
+            continue
+        if not queue.complete(unit):
+            # 他のワーカーが再取得済みのため、状態はそのワーカーの結果に任せる
+            print(f'[{worker_name}] リースが切れたため、完了を記録しませんでした。 {unit}')
+            continue
+        processed += 1
+    print(f'[{worker_name}] 終了 処理件数={processed}')
+    return processed
+
+
+def retry_failed(work_dir: str) -> int:
+    """
+    失敗した作業単位を未処理に戻します。完了済みの作業単位はやり直しません。
+
+    Returns:
+        int: 未処理に戻した作業単位の件数
+    """
+    count = get_queue(work_dir).retry_failed()
+    print(f'失敗した作業単位を未処理に戻しました。件数={count}')
+    return count
+
+
+def iter_partial(file_name: str) -> Iterator[LogEntry]:
+    """
+    中間結果ファイルのログエントリを1行ずつ返す（各ファイルは日時順に並んでいる）
+    """
+    with open(file_name, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield LogEntry.from_record(json.loads(line))
+
+
+def reduce(work_dir: str) -> bool:
+    """
+    すべての作業単位の中間結果を日時順に結合し、エクセルファイルに書き込みます。
+
+    Returns:
+        bool: 書き込みを行った場合はTrue、未完了の作業単位が残っている場合はFalse
+    """
+    queue = get_queue(work_dir)
+    status_counts = queue.status_counts()
+    if not set(status_counts) <= {'done'}:
+        print(f'未完了の作業単位があります。{status_counts}')
+        return False
+
+    meta = queue.get_meta()
+    # 同じ取得元・サーバの作業単位は日付が重ならず日付順に並んでいるため、順に連結するだけで日時順になる。
+    # 全ファイルを同時に開かないよう、取得元・サーバごとに連結した列だけをマージする
+    streams = []
+    for _, units in groupby(queue.units(), key=lambda unit: (unit.source, unit.server)):
+        file_names = [partial_path(work_dir, unit) for unit in units]
+        streams.append(chain.from_iterable(iter_partial(file_name) for file_name in file_names))
+    log_entries = merge_log_entries(*streams)
+
+    output_file_name = meta['output_file_name']
+    tab_name = meta['tab_name']
+    start_date = datetime.fromisoformat(meta['start_date'])
+    end_date = datetime.fromisoformat(meta['end_date'])
+    columns = EntryColumns()
+    write_to_excel(columns.collect(log_entries), output_file_name, tab_name, start_date, end_date)
+    write_time_series_arrays_to_excel(*columns.to_arrays(), start_date, end_date, output_file_name, tab_name)
+    print(f'エクセルファイルに書き込みました。件数={len(columns.epochs)} path={output_file_name}')
+    return True
+
+
+def run_local(work_dir: str, worker_count: int = DEFAULT_WORKER_COUNT) -> bool:
+    """
+    同一ホスト上でworker_count個のワーカープロセスを起動し、完了後にreduceします。
+    """
+    processes = [Process(target=worker, args=(work_dir,)) for _ in range(worker_count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return reduce(work_dir)
+
+
+if __name__ == "__main__":
+    import sys
+    import monthly_report
+    sys.exit(monthly_report.main(['backfill'] + sys.argv[1:]))
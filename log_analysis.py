@@ -0,0 +1,242 @@
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Tuple
+import numpy as np
+from openpyxl import load_workbook
+from openpyxl.chart import LineChart, Reference
+from log_entry import LogEntry
+from utils import LOG_TIMEZONE
+
+# 時系列シート名の接尾辞
+TIME_SERIES_SHEET_SUFFIX = '_時系列'
+
+# 集計単位（numpyのdatetime64単位, 表示フォーマット, スパイク判定の基準期間）
+BIN_HOUR = ('h', '%Y/%m/%d %H:00', 24)
+BIN_DAY = ('D', '%Y/%m/%d', 7)
+
+# スパイク判定の閾値（基準期間の平均 + 標準偏差 × SPIKE_SIGMA 超、かつ SPIKE_MIN_COUNT 件以上。標準偏差の下限は max(sqrt(平均), 1)）
+SPIKE_SIGMA = 3.0
+SPIKE_MIN_COUNT = 5
+
+
+class TimeSeries:
+    def __init__(self, bins: np.ndarray, groups: List[Tuple[str, str]], counts: np.ndarray, spikes: np.ndarray):
+        """
+        TimeSeriesクラスのコンストラクタ
+
+        Parameters:
+            bins (np.ndarray): 各区間の開始日時 (datetime64)
+            groups (List[Tuple[str, str]]): (対象サーバ, 検知箇所) のリスト
+            counts (np.ndarray): グループ × 区間 の件数 (shape: len(groups), len(bins))
+            spikes (np.ndarray): countsと同じshapeのスパイク判定結果
+        """
+        self.bins = bins
+        self.groups = groups
+        self.counts = counts
+        self.spikes = spikes
+
+
+class EntryColumns:
+    def __init__(self):
+        """
+        ログエントリを書き出しながら、集計に必要な列（日時・対象サーバ・検知箇所）だけを保持するクラス
+        """
+        self.epochs: List[int] = []
+        self.servers: List[str] = []
+        self.locations: List[str] = []
+
+    def collect(self, entries: Iterable[LogEntry]) -> Iterator[LogEntry]:
+        """
+        ログエントリをそのまま返しながら、各列を蓄積する
+        """
+        for entry in entries:
+            self.epochs.append(entry.epoch)
+            self.servers.append(entry.server)
+            self.locations.append(entry.location)
+            yield entry
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        蓄積した列をnumpy配列に変換する
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: LOG_TIMEZONEの日時(datetime64[s])、対象サーバ、検知箇所の配列
+        """
+        # エポック(ミリ秒)にタイムゾーンのオフセットを加え、LOG_TIMEZONEの時刻で区切れるようにする
+        offset = LOG_TIMEZONE.utcoffset(None) // timedelta(milliseconds=1)
+        timestamps = (np.array(self.epochs, dtype=np.int64) + offset).astype('datetime64[ms]').astype('datetime64[s]')
+        return timestamps, np.array(self.servers, dtype=str), np.array(self.locations, dtype=str)
+
+
+def bin_counts(timestamps: np.ndarray, servers: np.ndarray, locations: np.ndarray, unit: str,
+               start_date: datetime, end_date: datetime) -> Tuple[np.ndarray, List[Tuple[str, str]], np.ndarray]:
+    """
+    日時を指定単位で区切り、(対象サーバ, 検知箇所) ごとの件数を集計する
+
+    区間は集計期間全体（start_dateの0時からend_dateの終わりまで）で作成し、ログがない区間は0件とする。
+    集計期間外の日時は集計しない。
+
+    Parameters:
+        timestamps (np.ndarray): 日時の配列 (datetime64)
+        servers (np.ndarray): 対象サーバの配列
+        locations (np.ndarray): 検知箇所の配列
+        unit (str): 集計単位 ('h': 時間, 'D': 日)
+        start_date (datetime): 集計開始日（LOG_TIMEZONEの日付）
+        end_date (datetime): 集計終了日（LOG_TIMEZONEの日付）
+
+    Returns:
+        Tuple[np.ndarray, List[Tuple[str, str]], np.ndarray]: 区間の開始日時、グループ、件数
+    """
+    first = np.datetime64(start_date.date(), 'D').astype(f'datetime64[{unit}]')
+    last = (np.datetime64(end_date.date(), 'D') + 1).astype(f'datetime64[{unit}]') - 1
+    n_bins = max(int((last - first).astype(np.int64)) + 1, 0)
+    bins = first + np.arange(n_bins)
+
+    binned = timestamps.astype(f'datetime64[{unit}]')
+    in_period = (binned >= first) & (binned <= last)
+    binned = binned[in_period]
+    if binned.size == 0:
+        return bins, [], np.zeros((0, n_bins), dtype=np.int64)
+    bin_idx = (binned - first).astype(np.int64)
+
+    keys = np.char.add(np.char.add(servers[in_period], '\t'), locations[in_period])
+    unique_keys, group_idx = np.unique(keys, return_inverse=True)
+    groups = [tuple(key.split('\t', 1)) for key in unique_keys.tolist()]
+
+    counts = np.bincount(group_idx.ravel() * n_bins + bin_idx, minlength=len(groups) * n_bins)
+    return bins, groups, counts.reshape(len(groups), n_bins)
+
+
+def detect_spikes(counts: np.ndarray, window: int, sigma: float = SPIKE_SIGMA, min_count: int = SPIKE_MIN_COUNT) -> np.ndarray:
+    """
+    直前window区間の平均・標準偏差を基準にスパイクを判定する
+
+    Parameters:
+        counts (np.ndarray): グループ × 区間 の件数
+        window (int): 基準とする直前の区間数
+        sigma (float): 標準偏差の何倍を超えたらスパイクとするか
+        min_count (int): スパイクとみなす最小件数
+
+    Returns:
+        np.ndarray: countsと同じshapeの真偽値配列
+    """
+    if counts.size == 0:
+        return np.zeros(counts.shape, dtype=bool)
+
+    values = counts.astype(np.float64)
+    # 累積和から直前window区間（当該区間は含まない）の合計・二乗和を求める
+    zeros = np.zeros((values.shape[0], 1))
+    cumsum = np.concatenate([zeros, np.cumsum(values, axis=1)], axis=1)
+    cumsq = np.concatenate([zeros, np.cumsum(values ** 2, axis=1)], axis=1)
+    end = np.arange(values.shape[1])
+    start = np.maximum(end - window, 0)
+    n = (end - start).astype(np.float64)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (cumsum[:, end] - cumsum[:, start]) / n
+        var = (cumsq[:, end] - cumsq[:, start]) / n - mean ** 2
+    std = np.sqrt(np.clip(np.nan_to_num(var), 0, None))
+    mean = np.nan_to_num(mean)
+    # 基準期間の件数が一定（分散0）だと平均をわずかに超えただけでスパイクになるため、
+    # 標準偏差の下限をポアソン分布の標準偏差 sqrt(平均)、かつ1件とする
+    std = np.maximum(std, np.maximum(np.sqrt(mean), 1.0))
+
+    # 基準期間が短すぎる先頭の区間はスパイク判定しない
+    return (n >= max(window // 2, 1)) & (values >= min_count) & (values > mean + sigma * std)
+
+
+def build_time_series(timestamps: np.ndarray, servers: np.ndarray, locations: np.ndarray, bin_spec: tuple,
+                      start_date: datetime, end_date: datetime) -> TimeSeries:
+    """
+    指定した集計単位で集計期間全体の時系列とスパイク判定結果を作成する
+    """
+    unit, _, window = bin_spec
+    bins, groups, counts = bin_counts(timestamps, servers, locations, unit, start_date, end_date)
+    return TimeSeries(bins, groups, counts, detect_spikes(counts, window))
+
+
+def write_series(sheet, series: TimeSeries, title: str, fmt: str, start_row: int, start_col: int) -> int:
+    """
+    時系列をシートに書き込み、折れ線グラフを配置する
+
+    Returns:
+        int: 書き込んだ最終行
+    """
+    sheet.cell(row=start_row, column=start_col, value=title)
+    header_row = start_row + 1
+    sheet.cell(row=header_row, column=start_col, value='日時')
+    for idx, (server, location) in enumerate(series.groups):
+        sheet.cell(row=header_row, column=start_col + 1 + idx, value=f'{server}/{location}')
+
+    labels = series.bins.astype('datetime64[s]').astype(datetime)
+    for row_idx, (label, row) in enumerate(zip(labels, series.counts.T.tolist()), start=header_row + 1):
+        sheet.cell(row=row_idx, column=start_col, value=label.strftime(fmt))
+        for idx, value in enumerate(row):
+            sheet.cell(row=row_idx, column=start_col + 1 + idx, value=value)
+
+    last_row = header_row + len(labels)
+    if series.groups and len(labels) > 0:
+        chart = LineChart()
+        chart.title = title
+        chart.y_axis.title = '件数'
+        chart.width = 30
+        data = Reference(sheet, min_col=start_col + 1, max_col=start_col + len(series.groups), min_row=header_row, max_row=last_row)
+        categories = Reference(sheet, min_col=start_col, min_row=header_row + 1, max_row=last_row)
+        chart.add_data(data, titles_from_data=True)
+        chart.set_categories(categories)
+        sheet.add_chart(chart, sheet.cell(row=start_row, column=start_col + len(series.groups) + 2).coordinate)
+    return last_row
+
+
+def write_spikes(sheet, series_list: List[Tuple[str, str, TimeSeries]], start_row: int) -> None:
+    """
+    スパイク判定された区間の一覧をシートに書き込む
+    """
+    sheet.cell(row=start_row, column=1, value='スパイク検知')
+    row_idx = start_row + 1
+    for idx, value in enumerate(['集計単位', '日時', '対象サーバ', '検知箇所', '件数']):
+        sheet.cell(row=row_idx, column=1 + idx, value=value)
+
+    for title, fmt, series in series_list:
+        group_idx, bin_idx = np.nonzero(series.spikes)
+        labels = series.bins[bin_idx].astype('datetime64[s]').astype(datetime)
+        for g, b, label in zip(group_idx.tolist(), bin_idx.tolist(), labels):
+            row_idx += 1
+            server, location = series.groups[g]
+            row = [title, label.strftime(fmt), server, location, int(series.counts[g, b])]
+            for idx, value in enumerate(row):
+                sheet.cell(row=row_idx, column=1 + idx, value=value)
+
+
+def write_time_series_arrays_to_excel(timestamps: np.ndarray, servers: np.ndarray, locations: np.ndarray,
+                                      start_date: datetime, end_date: datetime, file_name: str, tab_name: str) -> None:
+    """
+    日時・対象サーバ・検知箇所の配列から時間別・日別件数とスパイク検知結果をエクセルファイルに書き込む
+
+    :param timestamps: 日時の配列 (datetime64)
+    :param servers: 対象サーバの配列
+    :param locations: 検知箇所の配列
+    :param start_date: 集計開始日
+    :param end_date: 集計終了日
+    :param file_name: 出力するエクセルファイル名
+    :param tab_name: ログを出力したタブ名（時系列シート名の接頭辞として使用）
+    """
+    hourly = build_time_series(timestamps, servers, locations, BIN_HOUR, start_date, end_date)
+    daily = build_time_series(timestamps, servers, locations, BIN_DAY, start_date, end_date)
+
+    workbook = load_workbook(filename=file_name)
+    sheet_name = f'{tab_name}{TIME_SERIES_SHEET_SUFFIX}'
+    if sheet_name in workbook.sheetnames:
+        del workbook[sheet_name]
+    sheet = workbook.create_sheet(sheet_name)
+
+    # スパイク一覧 → 日別 → 時間別の順に縦に並べる
+    series_list = [('日別', BIN_DAY[1], daily), ('時間別', BIN_HOUR[1], hourly)]
+    spike_rows = int(daily.spikes.sum() + hourly.spikes.sum())
+    row = 1
+    write_spikes(sheet, series_list, row)
+    row += spike_rows + 4
+    # グラフが重ならないよう、日別グラフの高さ（約15行）を確保する
+    row = max(write_series(sheet, daily, '日別件数', BIN_DAY[1], row, 1), row + 15) + 3
+    write_series(sheet, hourly, '時間別件数', BIN_HOUR[1], row, 1)
+
+    workbook.save(file_name)
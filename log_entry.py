@@ -1,14 +1,75 @@
+import heapq
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator
+from utils import LOG_TIMEZONE
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
 class LogEntry:
-    def __init__(self, date: str, server: str, location: str, content: str):
-        self.date = date
+    def __init__(self, date: datetime, server: str, location: str, content: str):
+        """
+        LogEntryクラスのコンストラクタ
+
+        Parameters:
+            date (datetime): ログの日時。タイムゾーンなしの場合はLOG_TIMEZONEの日時とみなす
+            server (str): 対象サーバ
+            location (str): 検知箇所
+            content (str): ログの内容
+        """
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=LOG_TIMEZONE)
+        self.date = date.astimezone(LOG_TIMEZONE)
+        # 並び替え・集計用のUNIXエポック(ミリ秒)
+        self.epoch = (date - EPOCH) // timedelta(milliseconds=1)
         self.server = server
         self.location = location
         self.content = content
 
+    @classmethod
+    def from_epoch(cls, epoch: int, server: str, location: str, content: str) -> 'LogEntry':
+        """
+        UNIXエポック(ミリ秒)から LogEntry を作成する
+        """
+        return cls(EPOCH + timedelta(milliseconds=epoch), server, location, content)
+
     def to_dict(self):
         return {
             "日付": self.date,
             "対象サーバ": self.server,
             "検知箇所": self.location,
             "ログの内容": self.content
-        }
\ No newline at end of file
+        }
+
+    def to_record(self) -> dict:
+        """
+        JSONで保存できる形式に変換する（分散実行の中間結果用）
+        """
+        return {
+            "epoch": self.epoch,
+            "server": self.server,
+            "location": self.location,
+            "content": self.content
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> 'LogEntry':
+        """
+        to_record で変換した形式から LogEntry を復元する
+        """
+        return cls.from_epoch(record["epoch"], record["server"], record["location"], record["content"])
+
+
+def merge_log_entries(*streams: Iterable[LogEntry]) -> Iterator[LogEntry]:
+    """
+    日時順に並んだ複数のログエントリの列を、全体をリストにせずに日時順に結合する（k-wayマージ）
+
+    同じ日時のエントリは引数の順に並ぶ。
+
+    Parameters:
+        streams (Iterable[LogEntry]): それぞれ日時順に並んだログエントリの列
+
+    Returns:
+        Iterator[LogEntry]: 日時順のログエントリ
+    """
+    return heapq.merge(*streams, key=lambda entry: entry.epoch)
@@ -0,0 +1,238 @@
+import argparse
+import os
+import re
+import sys
+import time
+import traceback
+from datetime import datetime
+from typing import Callable, List
+
+# このモジュールではboto3・openpyxl・numpyを読み込まない。
+# 各サブコマンドが必要なモジュールだけを実行時に読み込むため、checkなどはboto3の読み込みを待たずに起動できる。
+
+DATE_FORMAT = '%Y/%m/%d'
+
+
+def parse_date(value: str) -> datetime:
+    try:
+        return datetime.strptime(value, DATE_FORMAT)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'日付は {DATE_FORMAT} 形式で指定してください: {value}')
+
+
+def parse_no_list(value: str) -> List[int]:
+    try:
+        return [int(x) for x in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'番号はカンマ区切りの整数で指定してください: {value}')
+
+
+def watch(run: Callable[[], object], interval: float) -> int:
+    """
+    指定した間隔で処理を繰り返し実行します。（常駐モード）
+
+    同じプロセスで実行し続けるため、読み込み済みのモジュールや作成済みのAWSクライアントは次回以降も使い回されます。
+    1回の実行で例外が発生しても常駐は継続します。
+
+    Parameters:
+        run (Callable[[], object]): 実行する処理
+        interval (float): 実行開始の間隔（秒）
+    """
+    try:
+        while True:
+            started = time.monotonic()
+            print(f'実行開始: {datetime.now():%Y/%m/%d %H:%M:%S}')
+            try:
+                run()
+            except Exception:
+                traceback.print_exc()
+            elapsed = time.monotonic() - started
+            print(f'実行終了: {elapsed:.1f}秒 次回実行まで{max(interval - elapsed, 0):.0f}秒待機します。')
+            time.sleep(max(interval - elapsed, 0))
+    except KeyboardInterrupt:
+        print('常駐モードを終了します。')
+    return 0
+
+
+def run_fetch(args) -> int:
+    import get_log_php
+    import get_log_laravel
+    from log_entry import merge_log_entries
+
+    def run():
+        output_directory = args.output_dir or os.path.join(os.getcwd(), datetime.today().strftime('%Y%m%d%H%M%S'))
+        streams = []
+        if args.source in ('php', 'all'):
+            streams.append(get_log_php.main(output_directory, args.start, args.end))
+        if args.source in ('laravel', 'all'):
+            streams.append(get_log_laravel.main(output_directory, args.start, args.end))
+        # 各取得元はイテレータを返すため、最後まで読み進めてログファイルを書き出す
+        count = sum(1 for _ in merge_log_entries(*streams))
+        print(f'ログを取得しました。件数={count} path={output_directory}')
+
+    if args.watch:
+        return watch(run, args.watch)
+    run()
+    return 0
+
+
+def run_report(args) -> int:
+    import get_log
+
+    def run():
+        return get_log.main(args.report_file, args.tab, args.start, args.end, args.output_dir)
+
+    if args.watch:
+        return watch(run, args.watch)
+    return 0 if run() else 1
+
+
+def run_check(args) -> int:
+    # 旧形式の位置引数（レポート 番号リスト 番号リスト ホワイトリスト ブラックリスト）は一括チェックと誤認するため受け付けない
+    if len(args.reports) > 1 and any(re.fullmatch(r'\d+(,\d+)*', path) and not os.path.exists(path) for path in args.reports):
+        print('番号リストやIPリストは位置引数ではなく --admin-no / --web-no / --white-list / --black-list で指定してください。', file=sys.stderr)
+        return 2
+
+    import blacklist_registration_checker as checker
+
+    white_list = args.white_list or checker.DEFAULT_WHITE_IP_FILE_PATH
+    black_list = args.black_list or checker.DEFAULT_BLACK_IP_FILE_PATH
+    # レポートが1件だけ指定された場合（省略時を含む）は従来どおり1件をチェックする
+    if len(args.reports) <= 1 and not any(os.path.isdir(path) for path in args.reports):
+        file_path = args.reports[0] if args.reports else checker.DEFAULT_FILE_PATH
+        checker.main(file_path, args.admin_no, args.web_no, white_list, black_list)
+        return 0
+    results = checker.main_batch(args.reports, args.admin_no, args.web_no, white_list, black_list, args.workers)
+    return 0 if all(results.values()) else 1
+
+
+def run_backfill(args) -> int:
+    import get_log_sharded
+    from get_log import get_default_report
+    from utils import get_aggregation_period
+
+    work_dir = args.work_dir or os.path.join(os.getcwd(), datetime.today().strftime('%Y%m%d%H%M%S'))
+    queue_exists = get_log_sharded.queue_exists(work_dir)
+
+    if args.action == 'plan' or (args.action == 'run' and (not queue_exists or args.force)):
+        default_output_file_name, default_tab_name = get_default_report()
+        output_file_name = args.report_file or default_output_file_name
+        if not os.path.exists(output_file_name):
+            print(f'出力先ファイルが見つかりません。path={output_file_name}')
+            return 1
+        default_start_date, default_end_date = get_aggregation_period()
+        if not get_log_sharded.plan(work_dir, args.start or default_start_date, args.end or default_end_date,
+                                    output_file_name, args.tab or default_tab_name, args.force, args.shared):
+            return 1
+    elif not queue_exists:
+        print(f'作業単位が作成されていません。先に plan を実行してください。path={work_dir}')
+        return 1
+    else:
+        # 作成済みの作業単位は作成時の集計期間・出力先で処理するため、異なる指定は無視せずエラーにする
+        ignored_options = find_ignored_backfill_options(args, work_dir)
+        if ignored_options:
+            print(f'作成済みの作業単位と異なる、または使用できないオプションが指定されています: {" ".join(ignored_options)}'
+                  f' 作り直す場合は plan --force を実行してください。path={work_dir}', file=sys.stderr)
+            return 2
+
+    if args.action == 'worker':
+        get_log_sharded.worker(work_dir, args.worker_name)
+    elif args.action == 'retry-failed':
+        get_log_sharded.retry_failed(work_dir)
+    elif args.action == 'reduce':
+        return 0 if get_log_sharded.reduce(work_dir) else 1
+    elif args.action == 'run':
+        return 0 if get_log_sharded.run_local(work_dir, args.workers or get_log_sharded.DEFAULT_WORKER_COUNT) else 1
+    return 0
+
+
+def find_ignored_backfill_options(args, work_dir: str) -> List[str]:
+    """
+    作成済みの作業単位の設定（集計期間・出力先・キューの種類）と異なるオプションを返す（--forceはplan・run以外では使用できない）
+    """
+    import get_log_sharded
+
+    meta = get_log_sharded.get_queue(work_dir).get_meta()
+    options = []
+    if args.start and args.start.isoformat() != meta['start_date']:
+        options.append('--start')
+    if args.end and args.end.isoformat() != meta['end_date']:
+        options.append('--end')
+    if args.report_file and os.path.abspath(args.report_file) != os.path.abspath(meta['output_file_name']):
+        options.append('--report-file')
+    if args.tab and args.tab != meta['tab_name']:
+        options.append('--tab')
+    if args.shared and not get_log_sharded.get_queue(work_dir, True).exists():
+        options.append('--shared')
+    if args.force:
+        options.append('--force')
+    return options
+
+
+def add_period_arguments(parser: argparse.ArgumentParser) -> None:
+    # argparseのヘルプは%書式で展開されるため、%をエスケープする
+    date_format = DATE_FORMAT.replace('%', '%%')
+    parser.add_argument('--start', type=parse_date, help=f'集計開始日 ({date_format}) 省略時は前月第2火曜日')
+    parser.add_argument('--end', type=parse_date, help=f'集計終了日 ({date_format}) 省略時は当月第2月曜日')
+
+
+def add_report_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--report-file', help='書き込むエラー報告レポート 省略時はダウンロードフォルダの当月分')
+    parser.add_argument('--tab', help='書き込むタブ名 省略時はレポートの日付 (%%Y%%m%%d)')
+
+
+def add_watch_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help='常駐して指定秒数ごとに繰り返し実行する')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='monthly_report', description='エラー報告レポート作成ツール')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    fetch = subparsers.add_parser('fetch', help='ログを取得してファイルに保存する')
+    fetch.add_argument('--source', choices=['php', 'laravel', 'all'], default='all', help='取得元 (デフォルト: all)')
+    fetch.add_argument('--output-dir', help='ログファイルの出力ディレクトリ')
+    add_period_arguments(fetch)
+    add_watch_argument(fetch)
+    fetch.set_defaults(handler=run_fetch)
+
+    report = subparsers.add_parser('report', help='ログを取得してエラー報告レポートに書き込む')
+    report.add_argument('--output-dir', help='ログファイルの出力ディレクトリ')
+    add_report_arguments(report)
+    add_period_arguments(report)
+    add_watch_argument(report)
+    report.set_defaults(handler=run_report)
+
+    check = subparsers.add_parser('check', help='エラー報告レポートのIPをブラックリスト・ホワイトリストと照合する')
+    check.add_argument('reports', nargs='*', help='エラー報告レポートまたはレポートを含むディレクトリ。複数指定時は一括チェック')
+    check.add_argument('--admin-no', type=parse_no_list, help='Admin側の対象番号 (例: 6,7,8,9)')
+    check.add_argument('--web-no', type=parse_no_list, help='Web側の対象番号 (例: 8,9)')
+    check.add_argument('--white-list', help='IPホワイトリストのファイル')
+    check.add_argument('--black-list', help='IPブラックリストのファイル')
+    check.add_argument('--workers', type=int, help='一括チェック時のプロセス数')
+    check.set_defaults(handler=run_check)
+
+    backfill = subparsers.add_parser('backfill', help='作業単位に分割して複数プロセス・複数ホストでレポートを作成する')
+    backfill.add_argument('action', choices=['plan', 'worker', 'retry-failed', 'reduce', 'run'],
+                          help='plan: 作業単位の作成 / worker: 作業単位の処理 / retry-failed: 失敗した作業単位を未処理に戻す'
+                               ' / reduce: レポートへの書き込み / run: plan・worker・reduceをまとめて実行')
+    backfill.add_argument('--force', action='store_true', help='plan・run時に既存の作業単位を破棄して作り直す')
+    backfill.add_argument('--work-dir', help='作業ディレクトリ（--shared を指定しない場合はローカルディスク上のディレクトリを指定）')
+    backfill.add_argument('--shared', action='store_true',
+                          help='plan時に複数ホスト用のキューを作成する（共有ストレージ上の作業ディレクトリで、各ホストから worker を実行する）')
+    backfill.add_argument('--workers', type=int, help='run時に起動するワーカープロセス数')
+    backfill.add_argument('--worker-name', help='worker時のワーカー名 (デフォルト: ホスト名:プロセスID)')
+    add_report_arguments(backfill)
+    add_period_arguments(backfill)
+    backfill.set_defaults(handler=run_backfill)
+
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import os
+import pytest
+from ipaddress import IPv4Address
+import blacklist_registration_checker as checker
+
+
+def write_ip_list(path, ips):
+    with open(path, 'w') as f:
+        f.write(''.join(f'deny from {ip}\n' for ip in ips))
+
+
+def expected(ips):
+    return frozenset(int(IPv4Address(ip)) for ip in ips)
+
+
+def test_load_ip_set_uses_cache(tmp_path):
+    path = str(tmp_path / 'black.txt')
+    write_ip_list(path, ['192.0.2.1', '198.51.100.2'])
+
+    assert checker.load_ip_set(path) == expected(['192.0.2.1', '198.51.100.2'])
+    assert os.path.isfile(path + checker.IP_CACHE_SUFFIX)
+    assert checker.load_ip_set(path) == expected(['192.0.2.1', '198.51.100.2'])
+
+
+def test_load_ip_set_rebuilds_truncated_cache(tmp_path):
+    path = str(tmp_path / 'black.txt')
+    cache_path = path + checker.IP_CACHE_SUFFIX
+    write_ip_list(path, ['192.0.2.1', '198.51.100.2'])
+    checker.load_ip_set(path)
+
+    with open(cache_path, 'rb') as f:
+        data = f.read()
+    with open(cache_path, 'wb') as f:
+        f.write(data[:-2])
+    os.utime(path, ns=(0, 0))
+
+    assert checker.load_ip_set(path) == expected(['192.0.2.1', '198.51.100.2'])
+    assert os.path.getsize(cache_path) == len(data)
+
+
+def test_load_ip_set_ignores_stale_cache(tmp_path):
+    path = str(tmp_path / 'black.txt')
+    write_ip_list(path, ['192.0.2.1'])
+    checker.load_ip_set(path)
+
+    write_ip_list(path, ['192.0.2.1', '203.0.113.3'])
+    os.utime(path, ns=(1, 1))
+
+    assert checker.load_ip_set(path) == expected(['192.0.2.1', '203.0.113.3'])
+
+
+def test_main_batch_exits_non_zero_without_reports(tmp_path):
+    white = str(tmp_path / 'white.txt')
+    black = str(tmp_path / 'black.txt')
+    write_ip_list(white, [])
+    write_ip_list(black, [])
+
+    with pytest.raises(SystemExit) as e:
+        checker.main_batch([str(tmp_path)], white_ip_file_path=white, black_ip_file_path=black)
+    assert e.value.code == 1
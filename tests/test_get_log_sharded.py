@@ -0,0 +1,55 @@
+import multiprocessing
+from datetime import datetime, timedelta
+import pytest
+from openpyxl import Workbook, load_workbook
+import get_log_sharded
+from log_entry import LogEntry
+
+
+def fake_fetch_day(server, day, output_directory):
+    # 取得元ごとに時刻をずらし、結合後に取得元が入り混じるようにする
+    offset = {'admin': 1, 'web': 2}[server]
+    return [LogEntry(day + timedelta(hours=hour, minutes=offset), server, 'テスト', f'{server} {day:%Y-%m-%d} {hour}')
+            for hour in range(0, 24, 8)]
+
+
+def fake_laravel_fetch_day(server, day, output_directory):
+    # Laravelログはタイムゾーンなしの日時を使うため、PHPログ側（タイムゾーン付き）と混在させる
+    return [LogEntry(day.replace(hour=hour, minute=30), server, 'アプリケーションログ', f'laravel {server} {hour}')
+            for hour in (3, 12)]
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                    reason='ワーカープロセスに差し替えたSOURCESを引き継ぐためforkが必要')
+@pytest.mark.parametrize('shared', [False, True])
+def test_run_local_merges_partials_in_order(tmp_path, monkeypatch, shared):
+    monkeypatch.setitem(get_log_sharded.SOURCES, 'php', (fake_fetch_day, ['admin', 'web']))
+    monkeypatch.setitem(get_log_sharded.SOURCES, 'laravel', (fake_laravel_fetch_day, ['web', 'admin']))
+
+    report = str(tmp_path / 'report.xlsx')
+    workbook = Workbook()
+    workbook.active.title = '20240109'
+    workbook.save(report)
+
+    work_dir = str(tmp_path / 'work')
+    assert get_log_sharded.plan(work_dir, datetime(2024, 1, 1), datetime(2024, 1, 3), report, '20240109', shared=shared)
+    assert get_log_sharded.run_local(work_dir, 3)
+
+    sheet = load_workbook(report)['20240109']
+    rows = [row for row in sheet.iter_rows(min_row=3, min_col=4, max_col=7, values_only=True) if row[0] is not None]
+    dates = [row[0] for row in rows]
+    assert len(rows) == 3 * (2 * 3 + 2 * 2)
+    assert dates == sorted(dates)
+    assert dates[0] == datetime(2024, 1, 1, 0, 1)
+    assert dates[-1] == datetime(2024, 1, 3, 16, 2)
+    assert sheet['A1'].value == f'集計期間:{datetime(2024, 1, 1)}~{datetime(2024, 1, 3)}'
+
+
+def test_plan_refuses_existing_queue_and_empty_period(tmp_path):
+    work_dir = str(tmp_path / 'work')
+    assert not get_log_sharded.plan(work_dir, datetime(2024, 1, 3), datetime(2024, 1, 1), 'report.xlsx', 'tab')
+    assert get_log_sharded.plan(work_dir, datetime(2024, 1, 1), datetime(2024, 1, 1), 'report.xlsx', 'tab')
+    assert not get_log_sharded.plan(work_dir, datetime(2024, 1, 1), datetime(2024, 1, 2), 'report.xlsx', 'tab', shared=True)
+    assert get_log_sharded.plan(work_dir, datetime(2024, 1, 1), datetime(2024, 1, 2), 'report.xlsx', 'tab', force=True, shared=True)
+    assert isinstance(get_log_sharded.get_queue(work_dir), get_log_sharded.FileWorkQueue)
+    assert len(get_log_sharded.get_queue(work_dir).units()) == 8
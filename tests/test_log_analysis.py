@@ -0,0 +1,100 @@
+from datetime import datetime
+import numpy as np
+from log_analysis import bin_counts, detect_spikes
+
+
+def to_arrays(rows):
+    timestamps = np.array([row[0] for row in rows], dtype='datetime64[s]')
+    servers = np.array([row[1] for row in rows], dtype=str)
+    locations = np.array([row[2] for row in rows], dtype=str)
+    return timestamps, servers, locations
+
+
+def test_bin_counts_zero_fills_whole_period():
+    rows = [
+        ('2024-01-05T10:00:00', 'admin', 'PHP'),
+        ('2024-01-05T23:59:59', 'admin', 'PHP'),
+        ('2024-01-07T00:00:00', 'web', 'Laravel'),
+    ]
+    bins, groups, counts = bin_counts(*to_arrays(rows), 'D', datetime(2024, 1, 1), datetime(2024, 1, 10))
+
+    assert bins[0] == np.datetime64('2024-01-01')
+    assert bins[-1] == np.datetime64('2024-01-10')
+    assert len(bins) == 10
+    assert groups == [('admin', 'PHP'), ('web', 'Laravel')]
+    assert counts.tolist() == [
+        [0, 0, 0, 0, 2, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 1, 0, 0, 0],
+    ]
+
+
+def test_bin_counts_hourly_covers_end_date():
+    rows = [('2024-01-02T23:30:00', 'admin', 'PHP')]
+    bins, groups, counts = bin_counts(*to_arrays(rows), 'h', datetime(2024, 1, 1), datetime(2024, 1, 2))
+
+    assert len(bins) == 48
+    assert bins[-1] == np.datetime64('2024-01-02T23', 'h')
+    assert counts.shape == (1, 48)
+    assert counts[0, -1] == 1
+
+
+def test_bin_counts_ignores_entries_outside_period():
+    rows = [
+        ('2023-12-31T23:59:59', 'admin', 'PHP'),
+        ('2024-01-01T00:00:00', 'admin', 'PHP'),
+        ('2024-01-04T00:00:00', 'web', 'PHP'),
+    ]
+    bins, groups, counts = bin_counts(*to_arrays(rows), 'D', datetime(2024, 1, 1), datetime(2024, 1, 3))
+
+    assert groups == [('admin', 'PHP')]
+    assert counts.tolist() == [[1, 0, 0]]
+
+
+def test_bin_counts_empty_input():
+    bins, groups, counts = bin_counts(*to_arrays([]), 'D', datetime(2024, 1, 1), datetime(2024, 1, 3))
+
+    assert len(bins) == 3
+    assert groups == []
+    assert counts.shape == (0, 3)
+
+
+def test_bin_counts_only_outside_period():
+    rows = [('2024-02-01T00:00:00', 'admin', 'PHP')]
+    bins, groups, counts = bin_counts(*to_arrays(rows), 'D', datetime(2024, 1, 1), datetime(2024, 1, 3))
+
+    assert groups == []
+    assert counts.shape == (0, 3)
+
+
+def test_detect_spikes_empty_input():
+    spikes = detect_spikes(np.zeros((0, 5), dtype=np.int64), 7)
+
+    assert spikes.shape == (0, 5)
+    assert spikes.dtype == bool
+
+
+def test_detect_spikes_flat_history_ignores_small_increase():
+    counts = np.array([[24] * 10 + [25]])
+
+    assert not detect_spikes(counts, 7).any()
+
+
+def test_detect_spikes_flags_large_increase():
+    counts = np.array([[24] * 10 + [60]])
+    spikes = detect_spikes(counts, 7)
+
+    assert spikes.tolist() == [[False] * 10 + [True]]
+
+
+def test_detect_spikes_quiet_series_needs_min_count():
+    counts = np.array([[0] * 10 + [4], [0] * 10 + [5]])
+    spikes = detect_spikes(counts, 7)
+
+    assert spikes[:, -1].tolist() == [False, True]
+
+
+def test_detect_spikes_skips_short_baseline():
+    counts = np.array([[0, 0, 100] + [0] * 7])
+    spikes = detect_spikes(counts, 7)
+
+    assert not spikes[0, 2]
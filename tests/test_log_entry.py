@@ -0,0 +1,48 @@
+from datetime import datetime, timezone
+import get_log_laravel
+from get_log_php import parse_log_entry
+from log_entry import LogEntry, merge_log_entries
+
+
+def test_merge_log_entries_mixes_naive_and_aware_datetimes():
+    # PHPログはUTCのエポック、Laravelログはタイムゾーンなし（LOG_TIMEZONE = JST）の日時
+    php = [
+        parse_log_entry({'timestamp': int(datetime(2024, 1, 1, 0, 30, tzinfo=timezone.utc).timestamp() * 1000), 'message': 'php 1'}, 'admin'),
+        parse_log_entry({'timestamp': int(datetime(2024, 1, 1, 2, 0, tzinfo=timezone.utc).timestamp() * 1000), 'message': 'php 2'}, 'admin'),
+    ]
+    laravel = [
+        LogEntry(datetime(2024, 1, 1, 9, 0), 'web', 'アプリケーションログ', 'laravel 1'),
+        LogEntry(datetime(2024, 1, 1, 10, 0), 'web', 'アプリケーションログ', 'laravel 2'),
+        LogEntry(datetime(2024, 1, 1, 12, 0), 'web', 'アプリケーションログ', 'laravel 3'),
+    ]
+
+    merged = [entry.content for entry in merge_log_entries(iter(php), iter(laravel))]
+
+    # 09:00 JST = 00:00 UTC, 09:30 JST = php 1, 11:00 JST = php 2
+    assert merged == ['laravel 1', 'php 1', 'laravel 2', 'php 2', 'laravel 3']
+
+
+def test_merge_log_entries_keeps_argument_order_for_same_time():
+    aware = LogEntry(datetime(2024, 1, 1, 0, 0, tzinfo=timezone.utc), 'admin', 'PHP', 'php')
+    naive = LogEntry(datetime(2024, 1, 1, 9, 0), 'web', 'アプリケーションログ', 'laravel')
+
+    assert aware.epoch == naive.epoch
+    assert [entry.content for entry in merge_log_entries([naive], [aware])] == ['laravel', 'php']
+
+
+def test_load_day_logs_sorts_out_of_order_lines(tmp_path, monkeypatch):
+    log_data = (
+        '[2024-01-01 10:00:02] production.ERROR: second\n'
+        '[2024-01-01 10:00:01] production.ERROR: first\n'
+        '[2024-01-01 10:00:03] production.INFO: third\n'
+    )
+
+    def fake_download(s3_bucket, s3_key, local_file_path):
+        with open(local_file_path, 'w') as f:
+            f.write(log_data)
+
+    monkeypatch.setattr(get_log_laravel, 'download_log_file', fake_download)
+
+    entries = get_log_laravel.fetch_day('web', datetime(2024, 1, 1), str(tmp_path))
+
+    assert [entry.content for entry in entries] == ['first', 'second']
@@ -0,0 +1,24 @@
+from openpyxl import Workbook
+import monthly_report
+
+
+def test_backfill_rejects_options_that_differ_from_existing_queue(tmp_path, capsys):
+    report = str(tmp_path / 'report.xlsx')
+    Workbook().save(report)
+    work_dir = str(tmp_path / 'work')
+    common = ['--work-dir', work_dir, '--report-file', report, '--tab', 'tab', '--start', '2024/01/01', '--end', '2024/01/02']
+
+    assert monthly_report.main(['backfill', 'plan'] + common) == 0
+    assert monthly_report.main(['backfill', 'plan'] + common) == 1
+    # 作成時と同じ指定は受け付ける
+    assert monthly_report.main(['backfill', 'retry-failed'] + common) == 0
+
+    assert monthly_report.main(['backfill', 'run', '--work-dir', work_dir, '--start', '2024/02/01', '--tab', 'other']) == 2
+    assert '--start --tab' in capsys.readouterr().err
+
+
+def test_check_rejects_legacy_positional_arguments(tmp_path):
+    report = str(tmp_path / 'report.xlsx')
+    Workbook().save(report)
+
+    assert monthly_report.main(['check', report, '6,7', '8,9']) == 2
@@ -0,0 +1,78 @@
+import os
+import pytest
+from work_queue import FileWorkQueue, WorkQueue, MAX_ATTEMPTS
+
+
+@pytest.fixture(params=['sqlite', 'file'])
+def make_queue(request, tmp_path):
+    def make(units, lease_seconds=60):
+        if request.param == 'sqlite':
+            queue = WorkQueue(os.path.join(tmp_path, 'queue.sqlite3'), lease_seconds=lease_seconds)
+        else:
+            queue = FileWorkQueue(os.path.join(tmp_path, 'queue'), lease_seconds=lease_seconds)
+        queue.create(units, {'start_date': '2024-01-01T00:00:00'})
+        return queue
+    return make
+
+
+def test_claim_returns_units_in_manifest_order(make_queue):
+    queue = make_queue([('php', 'admin', '2024-01-01'), ('php', 'admin', '2024-01-02')])
+
+    assert [queue.claim('a').day, queue.claim('b').day] == ['2024-01-01', '2024-01-02']
+    assert queue.claim('c') is None
+    assert queue.status_counts() == {'running': 2}
+    assert queue.get_meta() == {'start_date': '2024-01-01T00:00:00'}
+
+
+def test_stale_worker_cannot_overwrite_reclaimed_unit(make_queue):
+    queue = make_queue([('php', 'admin', '2024-01-01')], lease_seconds=0)
+    unit_a = queue.claim('a')
+    unit_b = queue.claim('b')
+    assert unit_b.unit_id == unit_a.unit_id
+
+    # 後から取得したワーカーの結果だけが記録される
+    assert queue.complete(unit_b)
+    assert not queue.fail(unit_a, 'error')
+    assert queue.status_counts() == {'done': 1}
+
+
+def test_complete_after_lease_lost_is_ignored(make_queue):
+    queue = make_queue([('php', 'admin', '2024-01-01')], lease_seconds=0)
+    unit_a = queue.claim('a')
+    unit_b = queue.claim('b')
+
+    assert not queue.complete(unit_a)
+    assert queue.fail(unit_b, 'error')
+    assert queue.status_counts() == {'pending': 1}
+
+
+def test_fail_marks_unit_failed_after_max_attempts(make_queue):
+    queue = make_queue([('php', 'admin', '2024-01-01')])
+    for _ in range(MAX_ATTEMPTS):
+        unit = queue.claim('a')
+        assert queue.fail(unit, 'error')
+    assert queue.claim('a') is None
+    assert queue.status_counts() == {'failed': 1}
+
+
+def test_retry_failed_keeps_done_units(make_queue):
+    queue = make_queue([('php', 'admin', '2024-01-01'), ('php', 'admin', '2024-01-02')])
+    assert queue.complete(queue.claim('a'))
+    for _ in range(MAX_ATTEMPTS):
+        assert queue.fail(queue.claim('a'), 'error')
+    assert queue.status_counts() == {'done': 1, 'failed': 1}
+
+    assert queue.retry_failed() == 1
+    assert queue.status_counts() == {'done': 1, 'pending': 1}
+    assert queue.claim('a').day == '2024-01-02'
+
+
+def test_file_queue_claim_is_exclusive_across_instances(tmp_path):
+    # 別ホストのワーカーを想定し、同じディレクトリを別のインスタンスから操作する
+    queue_dir = os.path.join(tmp_path, 'queue')
+    FileWorkQueue(queue_dir).create([('php', 'admin', '2024-01-01')], {})
+    host_a = FileWorkQueue(queue_dir)
+    host_b = FileWorkQueue(queue_dir)
+
+    assert host_a.claim('a') is not None
+    assert host_b.claim('b') is None
@@ -1,11 +1,14 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 import os
-import sys
 from typing import List, Tuple
 
 # ダウンロードのパス
 DOWNLOAD_PATH = os.path.join(os.path.expanduser('~') , 'Downloads')
 
+# ログ日時のタイムゾーン（Laravelログのタイムゾーンなし日時はこのタイムゾーンとみなす）
+LOG_TIMEZONE = timezone(timedelta(hours=9), 'JST')
+
 
 def get_nth_weekday_of_month(months_ago: int, week_number: int, weekday: int) -> datetime:
     """
@@ -74,8 +77,20 @@ def get_aggregation_period() -> Tuple[datetime, datetime]:
     """
     return get_nth_weekday_of_month(1, 2, 1), get_nth_weekday_of_month(0, 2, 0)
 
-def get_sys_arg(idx: int, default):
-    return sys.argv[idx] if len(sys.argv) > idx else default
+@lru_cache(maxsize=None)
+def get_aws_client(service_name: str, region_name: str = None):
+    """
+    AWSのクライアントを取得します。
+
+    boto3は読み込みに時間がかかるため、必要になった時点で読み込みます。
+    作成したクライアントはプロセス内で使い回すため、常駐モードでは2回目以降の実行で作成コストがかかりません。
 
-def get_sys_arg_date(idx: int, default: datetime) -> datetime:
-    return datetime.strptime(sys.argv[idx], "%Y/%m/%d") if len(sys.argv) > idx else default
\ No newline at end of file
+    Parameters:
+        service_name (str): サービス名 ('logs', 's3' など)
+        region_name (str): リージョン名
+
+    Returns:
+        クライアント
+    """
+    import boto3
+    return boto3.client(service_name, region_name=region_name)
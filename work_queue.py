@@ -0,0 +1,445 @@
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# 作業単位の状態
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# 処理中のまま放置された作業単位を再取得するまでの秒数（ワーカー異常終了時の救済）
+DEFAULT_LEASE_SECONDS = 30 * 60
+
+# 失敗した作業単位を再試行する最大回数
+MAX_ATTEMPTS = 3
+
+# SQLiteのロック待ち秒数
+LOCK_TIMEOUT_SECONDS = 60
+
+
+class WorkUnit:
+    def __init__(self, unit_id: int, source: str, server: str, day: str, worker: str = None, attempts: int = None):
+        """
+        WorkUnitクラスのコンストラクタ
+
+        Parameters:
+            unit_id (int): 作業単位のID
+            source (str): ログの取得元 ('php', 'laravel')
+            server (str): サーバ名 ('admin', 'web')
+            day (str): 対象日付 (%Y-%m-%d)
+            worker (str): 取得したワーカー名（claimで取得した場合のみ）
+            attempts (int): 取得時点の試行回数（claimで取得した場合のみ）
+        """
+        self.unit_id = unit_id
+        self.source = source
+        self.server = server
+        self.day = day
+        self.worker = worker
+        self.attempts = attempts
+
+    def __str__(self) -> str:
+        return f"unit:{self.unit_id}, source:{self.source}, server:{self.server}, day:{self.day}"
+
+    def day_as_datetime(self) -> datetime:
+        return datetime.strptime(self.day, '%Y-%m-%d')
+
+
+class WorkQueue:
+    def __init__(self, db_path: str, lease_seconds: int = DEFAULT_LEASE_SECONDS):
+        """
+        SQLiteファイルを使った作業単位のキュー
+
+        同一ホスト上の複数プロセスから同時に作業単位を取得できます。
+        取得処理は BEGIN IMMEDIATE で書き込みロックを取ってから行うため、同じ作業単位が二重に取得されることはありません。
+        SQLiteのロックはNFS・SMBなどのネットワークファイルシステムでは信頼できないため、
+        キューのファイルはローカルディスクに置き、複数ホストで共有しないでください。（複数ホストで分担する場合は FileWorkQueue を使用）
+
+        Parameters:
+            db_path (str): キューのSQLiteファイルのパス
+            lease_seconds (int): 処理中の作業単位を他のワーカーが再取得できるようになるまでの秒数
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+
+    def _connect(self) -> sqlite3.Connection:
+        # トランザクションは明示的に制御する
+        return sqlite3.connect(self.db_path, timeout=LOCK_TIMEOUT_SECONDS, isolation_level=None)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.db_path)
+
+    def remove(self) -> None:
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+    def create(self, units: List[tuple], meta: dict) -> None:
+        """
+        作業単位のマニフェストを作成する。既存のキューは破棄される（呼び出し側でexistsを確認すること）。
+
+        Parameters:
+            units (List[tuple]): (source, server, day) のリスト
+            meta (dict): 集計期間や出力先ファイルなど、reduce時に必要な情報
+        """
+        self.remove()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('''CREATE TABLE units (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                server TEXT NOT NULL,
+                day TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT)''')
+            conn.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', meta.items())
+            conn.executemany('INSERT INTO units (source, server, day, status) VALUES (?, ?, ?, ?)',
+                             [(source, server, day, STATUS_PENDING) for source, server, day in units])
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def get_meta(self) -> dict:
+        conn = self._connect()
+        try:
+            return dict(conn.execute('SELECT key, value FROM meta').fetchall())
+        finally:
+            conn.close()
+
+    def claim(self, worker: str) -> Optional[WorkUnit]:
+        """
+        未処理の作業単位を1件取得し、処理中にする
+
+        Returns:
+            Optional[WorkUnit]: 取得した作業単位。残っていない場合はNone
+        """
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            expired = now - self.lease_seconds
+            # 再試行回数を使い切ったまま放置された作業単位（ワーカーの異常終了を繰り返すもの）は失敗にする
+            conn.execute('''UPDATE units SET status = ?, error = ?
+                WHERE status = ? AND claimed_at < ? AND attempts >= ?''',
+                         (STATUS_FAILED, 'ワーカーが処理中に終了しました。', STATUS_RUNNING, expired, MAX_ATTEMPTS))
+            row = conn.execute('''SELECT id, source, server, day, attempts FROM units
+                WHERE status = ? OR (status = ? AND claimed_at < ? AND attempts < ?)
+                ORDER BY id LIMIT 1''', (STATUS_PENDING, STATUS_RUNNING, expired, MAX_ATTEMPTS)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute('UPDATE units SET status = ?, worker = ?, claimed_at = ?, attempts = attempts + 1 WHERE id = ?',
+                         (STATUS_RUNNING, worker, now, row[0]))
+            conn.execute('COMMIT')
+            return WorkUnit(*row[:4], worker, row[4] + 1)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def retry_failed(self) -> int:
+        """
+        失敗した作業単位を試行回数0の未処理に戻す（完了済みの作業単位はそのまま残す）
+
+        Returns:
+            int: 未処理に戻した作業単位の件数
+        """
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            expired = time.time() - self.lease_seconds
+            # 再試行回数を使い切ったまま放置された作業単位もclaim時に失敗となるため、合わせて戻す
+            cursor = conn.execute('''UPDATE units SET status = ?, worker = NULL, claimed_at = NULL, attempts = 0, error = NULL
+                WHERE status = ? OR (status = ? AND claimed_at < ? AND attempts >= ?)''',
+                                  (STATUS_PENDING, STATUS_FAILED, STATUS_RUNNING, expired, MAX_ATTEMPTS))
+            conn.execute('COMMIT')
+            return cursor.rowcount
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def complete(self, unit: WorkUnit) -> bool:
+        """
+        作業単位を完了にする
+
+        Returns:
+            bool: 更新した場合はTrue。リースが切れて他のワーカーに再取得されていた場合はFalse
+        """
+        return self._update(unit, STATUS_DONE, None)
+
+    def fail(self, unit: WorkUnit, error: str) -> bool:
+        """
+        作業単位を失敗にする。再試行回数が残っていれば未処理に戻す。
+
+        Returns:
+            bool: 更新した場合はTrue。リースが切れて他のワーカーに再取得されていた場合はFalse
+        """
+        return self._update(unit, STATUS_PENDING if unit.attempts < MAX_ATTEMPTS else STATUS_FAILED, error)
+
+    def _update(self, unit: WorkUnit, status: str, error: Optional[str]) -> bool:
+        # 取得時のワーカー名・試行回数が一致する場合（リースを保持している場合）のみ更新する
+        conn = self._connect()
+        try:
+            cursor = conn.execute('''UPDATE units SET status = ?, error = ?
+                WHERE id = ? AND status = ? AND worker = ? AND attempts = ?''',
+                                  (status, error, unit.unit_id, STATUS_RUNNING, unit.worker, unit.attempts))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def units(self) -> List[WorkUnit]:
+        """
+        全作業単位をマニフェストの順に返す
+        """
+        conn = self._connect()
+        try:
+            return [WorkUnit(*row) for row in conn.execute('SELECT id, source, server, day FROM units ORDER BY id')]
+        finally:
+            conn.close()
+
+    def status_counts(self) -> dict:
+        conn = self._connect()
+        try:
+            return dict(conn.execute('SELECT status, COUNT(*) FROM units GROUP BY status').fetchall())
+        finally:
+            conn.close()
+
+
+class FileWorkQueue:
+    MANIFEST_FILE_NAME = 'manifest.json'
+    CLAIM_DIR_NAME = 'claims'
+    FAILURE_DIR_NAME = 'failures'
+    DONE_DIR_NAME = 'done'
+
+    def __init__(self, queue_dir: str, lease_seconds: int = DEFAULT_LEASE_SECONDS):
+        """
+        共有ストレージ上のファイルを使った作業単位のキュー（WorkQueueと同じ操作を持つ）
+
+        NFS・SMBなどで共有した作業ディレクトリを複数ホストから参照し、作業単位を分担できます。
+        ロックは使わず、作業単位の取得は「claims/ID.試行回数」ファイルを O_CREAT|O_EXCL で作成できたワーカーだけが成功します。
+        （排他作成はNFSv3以降・SMBで原子的に行われるため、同じ作業単位の同じ試行を二重に取得することはありません）
+        完了は「done/ID」、失敗は「failures/ID.試行回数」ファイルで記録し、状態はこれらのファイルから求めます。
+        リースの期限は取得したホストの時刻で判定するため、各ホストの時刻は同期しておいてください。
+
+        Parameters:
+            queue_dir (str): キューのディレクトリ
+            lease_seconds (int): 処理中の作業単位を他のワーカーが再取得できるようになるまでの秒数
+        """
+        self.queue_dir = queue_dir
+        self.lease_seconds = lease_seconds
+        self.manifest_path = os.path.join(queue_dir, self.MANIFEST_FILE_NAME)
+        self.claim_dir = os.path.join(queue_dir, self.CLAIM_DIR_NAME)
+        self.failure_dir = os.path.join(queue_dir, self.FAILURE_DIR_NAME)
+        self.done_dir = os.path.join(queue_dir, self.DONE_DIR_NAME)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def remove(self) -> None:
+        if os.path.exists(self.queue_dir):
+            shutil.rmtree(self.queue_dir)
+
+    def create(self, units: List[tuple], meta: dict) -> None:
+        """
+        作業単位のマニフェストを作成する。既存のキューは破棄される（呼び出し側でexistsを確認すること）。
+
+        Parameters:
+            units (List[tuple]): (source, server, day) のリスト
+            meta (dict): 集計期間や出力先ファイルなど、reduce時に必要な情報
+        """
+        self.remove()
+        for directory in (self.claim_dir, self.failure_dir, self.done_dir):
+            os.makedirs(directory)
+        # マニフェストが存在すればキューが作成済みとみなすため、最後に置き換えで作成する
+        write_file_atomic(self.manifest_path, json.dumps({'meta': meta, 'units': [list(unit) for unit in units]}, ensure_ascii=False))
+
+    def _manifest(self) -> dict:
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get_meta(self) -> dict:
+        return self._manifest()['meta']
+
+    def units(self) -> List[WorkUnit]:
+        """
+        全作業単位をマニフェストの順に返す
+        """
+        return [WorkUnit(unit_id, *unit) for unit_id, unit in enumerate(self._manifest()['units'], start=1)]
+
+    def _claim_path(self, unit_id: int, attempts: int) -> str:
+        return os.path.join(self.claim_dir, f'{unit_id:06d}.{attempts}')
+
+    def _failure_path(self, unit_id: int, attempts: int) -> str:
+        return os.path.join(self.failure_dir, f'{unit_id:06d}.{attempts}')
+
+    def _done_path(self, unit_id: int) -> str:
+        return os.path.join(self.done_dir, f'{unit_id:06d}')
+
+    def _read_claim(self, unit_id: int, attempts: int) -> Optional[dict]:
+        """
+        取得ファイルの内容（worker, claimed_at）を返す。作成直後で書き込み中の場合はファイルの更新日時を取得日時とする。
+        """
+        path = self._claim_path(unit_id, attempts)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            try:
+                return {'worker': None, 'claimed_at': os.stat(path).st_mtime}
+            except FileNotFoundError:
+                return None
+
+    def _states(self) -> Dict[int, Tuple[str, int]]:
+        """
+        全作業単位の状態を求める
+
+        Returns:
+            Dict[int, Tuple[str, int]]: 作業単位のIDごとの (状態, 試行回数)。
+                状態がSTATUS_RUNNINGでリースが切れたものは再取得できるため STATUS_PENDING として返す
+        """
+        done = {int(name) for name in os.listdir(self.done_dir) if name.isdigit()}
+        attempts: Dict[int, int] = {}
+        for name in os.listdir(self.claim_dir):
+            unit_id, _, attempt = name.partition('.')
+            if unit_id.isdigit() and attempt.isdigit():
+                attempts[int(unit_id)] = max(attempts.get(int(unit_id), 0), int(attempt))
+        failures = set(os.listdir(self.failure_dir))
+
+        expired = time.time() - self.lease_seconds
+        states = {}
+        for unit in self.units():
+            unit_id = unit.unit_id
+            attempt = attempts.get(unit_id, 0)
+            if unit_id in done:
+                status = STATUS_DONE
+            elif attempt == 0:
+                status = STATUS_PENDING
+            elif f'{unit_id:06d}.{attempt}' in failures:
+                status = STATUS_PENDING if attempt < MAX_ATTEMPTS else STATUS_FAILED
+            else:
+                claim = self._read_claim(unit_id, attempt)
+                if claim is not None and claim['claimed_at'] >= expired:
+                    status = STATUS_RUNNING
+                else:
+                    # 処理中のまま放置された作業単位は、再試行回数が残っていれば再取得できる
+                    status = STATUS_PENDING if attempt < MAX_ATTEMPTS else STATUS_FAILED
+            states[unit_id] = (status, attempt)
+        return states
+
+    def claim(self, worker: str) -> Optional[WorkUnit]:
+        """
+        未処理の作業単位を1件取得し、処理中にする
+
+        Returns:
+            Optional[WorkUnit]: 取得した作業単位。残っていない場合はNone
+        """
+        states = self._states()
+        for unit in self.units():
+            status, attempts = states[unit.unit_id]
+            if status != STATUS_PENDING:
+                continue
+            try:
+                fd = os.open(self._claim_path(unit.unit_id, attempts + 1), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # 他のワーカーが先に取得した
+                continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'worker': worker, 'claimed_at': time.time()}, ensure_ascii=False))
+            unit.worker = worker
+            unit.attempts = attempts + 1
+            return unit
+        return None
+
+    def _holds_lease(self, unit: WorkUnit) -> bool:
+        # 自分の取得ファイルが残っており、後続の試行で再取得されていない場合のみリースを保持している
+        claim = self._read_claim(unit.unit_id, unit.attempts)
+        return (claim is not None and claim['worker'] == unit.worker
+                and not os.path.exists(self._claim_path(unit.unit_id, unit.attempts + 1))
+                and not os.path.exists(self._done_path(unit.unit_id)))
+
+    def complete(self, unit: WorkUnit) -> bool:
+        """
+        作業単位を完了にする
+
+        Returns:
+            bool: 更新した場合はTrue。リースが切れて他のワーカーに再取得されていた場合はFalse
+        """
+        if not self._holds_lease(unit):
+            return False
+        try:
+            fd = os.open(self._done_path(unit.unit_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'worker': unit.worker, 'attempts': unit.attempts}, ensure_ascii=False))
+        return True
+
+    def fail(self, unit: WorkUnit, error: str) -> bool:
+        """
+        作業単位を失敗にする。再試行回数が残っていれば未処理に戻す。
+
+        Returns:
+            bool: 更新した場合はTrue。リースが切れて他のワーカーに再取得されていた場合はFalse
+        """
+        if not self._holds_lease(unit):
+            return False
+        write_file_atomic(self._failure_path(unit.unit_id, unit.attempts), error)
+        return True
+
+    def retry_failed(self) -> int:
+        """
+        失敗した作業単位を試行回数0の未処理に戻す（完了済みの作業単位はそのまま残す）
+
+        Returns:
+            int: 未処理に戻した作業単位の件数
+        """
+        failed = [unit_id for unit_id, (status, _) in self._states().items() if status == STATUS_FAILED]
+        prefixes = tuple(f'{unit_id:06d}.' for unit_id in failed)
+        for directory in (self.claim_dir, self.failure_dir):
+            for name in os.listdir(directory):
+                if name.startswith(prefixes):
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except FileNotFoundError:
+                        pass
+        return len(failed)
+
+    def status_counts(self) -> dict:
+        # リースが切れた処理中の作業単位は、SQLite版と同じく再取得されるまで処理中として数える
+        counts: Dict[str, int] = {}
+        for unit_id, (status, attempts) in self._states().items():
+            if status == STATUS_PENDING and attempts > 0 and not os.path.exists(self._failure_path(unit_id, attempts)):
+                status = STATUS_RUNNING
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+
+def write_file_atomic(path: str, content: str) -> None:
+    """
+    一時ファイルに書いてから置き換え、書き込み途中の内容が読まれないようにする
+    """
+    tmp_path = f'{path}.{socket.gethostname()}_{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def default_worker_name() -> str:
+    """
+    ホスト名とプロセスIDからワーカー名を作成する
+    """
+    return f'{socket.gethostname()}:{os.getpid()}'